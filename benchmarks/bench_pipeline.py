@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+import bot.leveling
+from bot.database import Database
+from bot.leveling import LevelingSystem
+from bot.events import Events
+from benchmarks.common import compare_metric, latency_summary, load_baseline, save_results
+
+class FakeClock:
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.now = start
+    
+    def time(self) -> float:
+        return self.now
+    
+    def monotonic(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float):
+        self.now += seconds
+
+class FakeAsset:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeRole:
+    def __init__(self, role_id: int):
+        self.id = role_id
+    
+    def is_default(self) -> bool:
+        return self.id == 0
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = 0
+    
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.channel = FakeChannel(guild_id)
+    
+    def get_role(self, role_id: int) -> FakeRole:
+        return FakeRole(role_id)
+
+class FakeMember:
+    bot = False
+    display_avatar = FakeAsset()
+    
+    def __init__(self, user_id: int, guild: FakeGuild):
+        self.id = user_id
+        self.guild = guild
+        self.mention = f"<@{user_id}>"
+        self.display_name = f"user{user_id}"
+        self.roles = [FakeRole(0)]
+        self.edits = 0
+    
+    async def edit(self, roles, reason=None):
+        self.roles = [FakeRole(0)] + list(roles)
+        self.edits += 1
+
+class FakeMessage:
+    __slots__ = ('author', 'guild', 'channel', 'content')
+    
+    def __init__(self, author: FakeMember, content: str):
+        self.author = author
+        self.guild = author.guild
+        self.channel = author.guild.channel
+        self.content = content
+
+class FakeBot:
+    def __init__(self, db: Database, leveling: LevelingSystem):
+        self.db = db
+        self.leveling = leveling
+    
+    def get_channel(self, channel_id: int):
+        return None
+
+def zipf_weights(count: int, exponent: float):
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+def generate_traffic(args, rng: random.Random):
+    guilds = [FakeGuild(1000 + g) for g in range(args.guilds)]
+    members = [
+        [FakeMember(10_000_000 + g * args.users + u, guild) for u in range(args.users)]
+        for g, guild in enumerate(guilds)
+    ]
+    cum_weights = zipf_weights(args.users, args.zipf)
+    words = ["gg", "hello", "level", "xp", "bot", "raid", "tonight", "anyone", "playing", "lol"]
+    
+    for _ in range(args.messages):
+        guild_members = members[rng.randrange(args.guilds)]
+        author = rng.choices(guild_members, cum_weights=cum_weights)[0]
+        content = " ".join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+        yield FakeMessage(author, content)
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    clock = FakeClock()
+    
+    # Deterministic XP rolls and a simulated clock, so two runs with the
+    # same seed award exactly the same XP and hit the same cooldowns.
+    bot.leveling.random = random.Random(args.seed + 1)
+    bot.leveling.time = clock
+    
+    workdir = tempfile.mkdtemp(prefix="levelbot-bench-")
+    db = Database(os.path.join(workdir, "bench.db"), flush_interval=args.flush_interval, max_pending=args.max_pending)
+    await db.initialize()
+    
+    leveling = LevelingSystem(db)
+    fake_bot = FakeBot(db, leveling)
+    events = Events(fake_bot, workers=args.workers, queue_size=args.queue_size)
+    
+    for g in range(args.guilds):
+        await db.update_guild_config(1000 + g, xp_cooldown=args.cooldown, level_roles={5: 5005, 10: 5010, 20: 5020})
+    
+    # Latency runs from on_message until the worker finishes the message, or
+    # until on_message returns for messages rejected before the queue.
+    started_at, finished_at = {}, {}
+    in_flight = 0
+    process = events.process_message
+    
+    async def handler(message):
+        nonlocal in_flight
+        in_flight += 1
+        try:
+            await process(message)
+        finally:
+            in_flight -= 1
+            finished_at[id(message)] = time.perf_counter_ns()
+    
+    events.queue.handler = handler
+    events.queue.start()
+    
+    interval = 1.0 / args.rate
+    messages = list(generate_traffic(args, rng))
+    
+    started = time.perf_counter()
+    for i in range(0, len(messages), args.concurrency):
+        batch = messages[i:i + args.concurrency]
+        clock.advance(interval * len(batch))
+        for message in batch:
+            started_at[id(message)] = time.perf_counter_ns()
+            await events.on_message(message)
+            finished_at.setdefault(id(message), time.perf_counter_ns())
+        while len(events.queue) or events.queue.deferred or in_flight:
+            await asyncio.sleep(0)
+    await db.flush()
+    elapsed = time.perf_counter() - started
+    
+    latencies = [finished_at[id(m)] - started_at[id(m)] for m in messages]
+    await events.cog_unload()
+    await db.close()
+    
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline')},
+        'elapsed_s': elapsed,
+        'throughput_msgs_per_s': len(messages) / elapsed if elapsed else 0.0,
+        'latency': latency_summary(latencies)
+    }
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay synthetic traffic through Events.on_message")
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--users", type=int, default=2_000, help="members per guild")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent for poster activity")
+    parser.add_argument("--cooldown", type=int, default=60)
+    parser.add_argument("--rate", type=float, default=500.0, help="simulated messages per second")
+    parser.add_argument("--concurrency", type=int, default=1, help="messages delivered per event loop turn")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=10_000)
+    parser.add_argument("--flush-interval", type=float, default=5.0)
+    parser.add_argument("--max-pending", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", help="write results to this file")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+    
+    results = asyncio.run(run(args))
+    latency = results['latency']
+    print(f"messages:   {latency['count']:,}")
+    print(f"throughput: {results['throughput_msgs_per_s']:,.0f} msg/s")
+    print(f"latency:    p50 {latency['p50_us']:.1f}us  p99 {latency['p99_us']:.1f}us  "
+          f"p999 {latency['p999_us']:.1f}us  max {latency['max_us']:.1f}us")
+    
+    if args.save_baseline:
+        save_results(args.save_baseline, results)
+    
+    if args.baseline:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"No baseline at {args.baseline}")
+            return 0
+        
+        regressions = [
+            compare_metric("throughput", results['throughput_msgs_per_s'], baseline['throughput_msgs_per_s'],
+                           args.tolerance, higher_is_better=True),
+            *(compare_metric(key, latency[key], baseline['latency'][key], args.tolerance, higher_is_better=False)
+              for key in ('p50_us', 'p99_us', 'p999_us'))
+        ]
+        regressions = [r for r in regressions if r]
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bot.database import Database
+from benchmarks.common import compare_metric, latency_summary, load_baseline, save_results
+
+# Representative statements behind each Database method, for EXPLAIN QUERY PLAN.
+# Writes have no plan of their own; the lookup behind an upsert's conflict
+# check is the primary-key search shown for get_user_data.
+QUERY_PLANS = {
+    'get_user_rank': ('''
+        SELECT COUNT(*) + 1 FROM user_levels
+        WHERE guild_id = ? AND xp > (SELECT xp FROM user_levels WHERE user_id = ? AND guild_id = ?)
+    ''', ('guild', 'user', 'guild')),
+    'get_leaderboard': ('''
+        SELECT user_id, xp, level, total_messages FROM user_levels
+        WHERE guild_id = ? ORDER BY xp DESC, user_id LIMIT 10 OFFSET 5000
+    ''', ('guild',)),
+    'get_leaderboard_page': ('''
+        SELECT user_id, xp, level, total_messages FROM user_levels
+        WHERE guild_id = ? AND xp <= ? AND (xp < ? OR user_id > ?)
+        ORDER BY xp DESC, user_id LIMIT 10
+    ''', ('guild', 'xp', 'xp', 'user')),
+    'get_user_data': ('''
+        SELECT xp, level, total_messages, last_message_time FROM user_levels
+        WHERE user_id = ? AND guild_id = ?
+    ''', ('user', 'guild')),
+    'build_rank_index': ('''
+        SELECT user_id, xp FROM user_levels WHERE guild_id = ? ORDER BY xp DESC, user_id
+    ''', ('guild',)),
+    'get_level_chunk': ('''
+        SELECT user_id, xp FROM user_levels WHERE guild_id = ? AND user_id > ? ORDER BY user_id LIMIT 500
+    ''', ('guild', 'user')),
+}
+
+def guild_sizes(rows: int, guilds: int):
+    weights = [1.0 / rank for rank in range(1, guilds + 1)]
+    total = sum(weights)
+    sizes = [max(1, int(rows * w / total)) for w in weights]
+    sizes[0] += rows - sum(sizes)
+    return sizes
+
+def seed(path: str, rows: int, guilds: int, rng: random.Random) -> list:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    sizes = guild_sizes(rows, guilds)
+    
+    def generate():
+        for g, size in enumerate(sizes):
+            guild_id = 1_000_000 + g
+            for u in range(size):
+                xp = int(rng.lognormvariate(6, 1.5))
+                yield (10_000_000 + u, guild_id, xp, int(0.1 * xp ** 0.5), xp // 20, 0.0)
+    
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO user_levels
+            (user_id, guild_id, xp, level, total_messages, last_message_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', generate())
+    conn.execute("ANALYZE")
+    conn.close()
+    return [(1_000_000 + g, size) for g, size in enumerate(sizes)]
+
+def query_plans(path: str, guild_id: int, user_id: int) -> dict:
+    conn = sqlite3.connect(path)
+    values = {'guild': guild_id, 'user': user_id, 'xp': 500}
+    plans = {}
+    for name, (sql, params) in QUERY_PLANS.items():
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, [values[p] for p in params]).fetchall()
+        plans[name] = [row[-1] for row in rows]
+    conn.close()
+    return plans
+
+async def measure(operations: int, concurrency: int, make_call) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter_ns()
+            await make_call(i)
+            latencies.append(time.perf_counter_ns() - start)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(operations)))
+    elapsed = time.perf_counter() - started
+    
+    summary = latency_summary(latencies)
+    summary['ops_per_s'] = operations / elapsed if elapsed else 0.0
+    return summary
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="levelbot-storage-"), "storage.db")
+    
+    db = Database(path, readers=args.readers)
+    await db.initialize()
+    await db.close()
+    
+    seed_started = time.perf_counter()
+    guilds = []
+    if args.reuse:
+        conn = sqlite3.connect(path)
+        guilds = conn.execute("SELECT guild_id, COUNT(*) FROM user_levels GROUP BY guild_id").fetchall()
+        conn.close()
+    if not guilds:
+        guilds = seed(path, args.rows, args.guilds, rng)
+    seed_elapsed = time.perf_counter() - seed_started
+    
+    db = Database(path, readers=args.readers)
+    await db.initialize()
+    
+    hot_guilds = [guild_id for guild_id, _ in sorted(guilds, key=lambda g: -g[1])[:10]]
+    largest_guild, largest_size = max(guilds, key=lambda g: g[1])
+    
+    def target(i):
+        local = random.Random(args.seed * 1_000_003 + i)
+        return 10_000_000 + local.randrange(largest_size), local.choice(hot_guilds)
+    
+    ops, conc = args.operations, args.concurrency
+    methods = {}
+    
+    async def rank_sql(i):
+        user_id, guild_id = target(i)
+        await db.get_user_rank(user_id, guild_id)
+    
+    db.ranks.oversized.update(hot_guilds)
+    methods['get_user_rank[sql]'] = await measure(max(1, ops // 10), conc, rank_sql)
+    methods['get_leaderboard[sql, offset]'] = await measure(
+        max(1, ops // 10), conc, lambda i: db.get_leaderboard(largest_guild, 10, args.deep_offset))
+    methods['get_leaderboard_page[sql]'] = await measure(
+        ops, conc, lambda i: db.get_leaderboard_page(largest_guild, 10, after=(500 + i % 100, 10_000_000)))
+    db.ranks.oversized.clear()
+    
+    build_started = time.perf_counter()
+    for guild_id in hot_guilds:
+        await db.count_ranked_users(guild_id)
+    methods['build_rank_index'] = {'elapsed_s': time.perf_counter() - build_started, 'guilds': len(hot_guilds)}
+    
+    methods['get_user_rank[index]'] = await measure(ops, conc, rank_sql)
+    methods['get_leaderboard[index, offset]'] = await measure(
+        ops, conc, lambda i: db.get_leaderboard(largest_guild, 10, args.deep_offset))
+    
+    async def config(i):
+        guild_id = 1_000_000 + i % len(guilds)
+        db.invalidate_guild_config(guild_id)
+        await db.get_guild_config(guild_id)
+    
+    methods['get_guild_config[cold]'] = await measure(ops, conc, config)
+    methods['get_guild_config[cached]'] = await measure(ops, conc, lambda i: db.get_guild_config(hot_guilds[i % 10]))
+    
+    async def update(i):
+        user_id, guild_id = target(i)
+        await db.update_user_data(user_id, guild_id, 1000 + i, 3, i, 0.0)
+    
+    async def set_xp(i):
+        user_id, guild_id = target(i)
+        await db.set_xp(user_id, guild_id, 2000 + i)
+    
+    async def increment(i):
+        user_id, guild_id = target(i)
+        await db.increment_xp(user_id, guild_id, 15, 1, 0.0)
+    
+    methods['update_user_data'] = await measure(ops, conc, update)
+    methods['set_xp'] = await measure(ops, conc, set_xp)
+    methods['increment_xp'] = await measure(ops, conc, increment)
+    
+    await db.close()
+    
+    return {
+        'config': {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline', 'thresholds')},
+        'rows': sum(size for _, size in guilds),
+        'guilds': len(guilds),
+        'largest_guild_rows': largest_size,
+        'seed_s': seed_elapsed,
+        'db_bytes': os.path.getsize(path),
+        'methods': methods,
+        'query_plans': query_plans(path, largest_guild, 10_000_000)
+    }
+
+def check(results: dict, baseline: dict, thresholds: dict, tolerance: float) -> list:
+    failures = []
+    for name, current in results['methods'].items():
+        if 'p99_us' not in current:
+            continue
+        
+        limit = thresholds.get(name, {})
+        for key, maximum in limit.items():
+            if current.get(key, 0) > maximum:
+                failures.append(f"{name} {key}: {current[key]:,.1f} exceeds threshold {maximum:,.1f}")
+        
+        previous = (baseline or {}).get('methods', {}).get(name)
+        if previous:
+            for key, higher_is_better in (('p99_us', False), ('ops_per_s', True)):
+                regression = compare_metric(f"{name} {key}", current[key], previous.get(key, 0), tolerance, higher_is_better)
+                if regression:
+                    failures.append(regression)
+    return failures
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time Database methods against a large synthetic user_levels table")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--guilds", type=int, default=2_000)
+    parser.add_argument("--operations", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--deep-offset", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--db", help="database file to use (default: temporary)")
+    parser.add_argument("--reuse", action="store_true", help="reuse rows already seeded in --db")
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", help="also write results to this file")
+    parser.add_argument("--thresholds", help="JSON file of {method: {metric: max}} limits")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+    
+    results = asyncio.run(run(args))
+    
+    if args.output:
+        save_results(args.output, results)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    if args.save_baseline:
+        save_results(args.save_baseline, results)
+    
+    thresholds = load_baseline(args.thresholds) if args.thresholds else {}
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    failures = check(results, baseline, thresholds or {}, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import json
+import math
+from typing import Dict, List, Optional
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def latency_summary(samples_ns: List[int]) -> Dict[str, float]:
+    values = sorted(samples_ns)
+    return {
+        'count': len(values),
+        'mean_us': (sum(values) / len(values) / 1000) if values else 0.0,
+        'p50_us': percentile(values, 0.50) / 1000,
+        'p99_us': percentile(values, 0.99) / 1000,
+        'p999_us': percentile(values, 0.999) / 1000,
+        'max_us': (values[-1] / 1000) if values else 0.0
+    }
+
+def load_baseline(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_results(path: str, results: dict):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def compare_metric(name: str, current: float, baseline: float, tolerance: float, higher_is_better: bool) -> Optional[str]:
+    if not baseline:
+        return None
+    change = (current - baseline) / baseline
+    regressed = change < -tolerance if higher_is_better else change > tolerance
+    if regressed:
+        return f"{name}: {baseline:,.2f} -> {current:,.2f} ({change:+.1%})"
+    return None
@@ -0,0 +1,137 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple
+import discord
+from .metrics import metrics, count_error
+
+class LevelUp(NamedTuple):
+    member: discord.abc.User
+    level: int
+    total_xp: int
+    total_messages: int
+
+class AnnouncementDispatcher:
+    def __init__(self, window: float = 2.0, send_interval: float = 1.0, max_batch: int = 20,
+                 max_per_channel: int = 100, max_concurrent_sends: int = 8):
+        self.window = window
+        self.send_interval = send_interval
+        self.max_batch = max_batch
+        self.max_per_channel = max_per_channel
+        self._sends = asyncio.Semaphore(max_concurrent_sends)
+        self._pending: Dict[int, 'OrderedDict[int, LevelUp]'] = {}
+        self._channels: Dict[int, discord.abc.Messageable] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._flush = asyncio.Event()
+        self._closed = False
+        
+        self.sent = metrics.counter("levelbot_announcements_sent_total", "Level-up messages sent")
+        self.merged = metrics.counter("levelbot_announcements_merged_total", "Level-ups folded into another announcement")
+        self.dropped = metrics.counter("levelbot_announcements_dropped_total", "Level-ups not announced because a channel backlog was full")
+    
+    def __len__(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+    
+    def announce(self, channel: discord.abc.Messageable, member: discord.abc.User, result: dict):
+        if self._closed:
+            return
+        
+        entry = LevelUp(member, result['new_level'], result['total_xp'], result['total_messages'])
+        pending = self._pending.get(channel.id)
+        if pending is None:
+            pending = self._pending[channel.id] = OrderedDict()
+        
+        if member.id in pending:
+            # A member who levels twice inside the window only needs the
+            # latest level announced.
+            pending[member.id] = entry
+            self.merged.inc()
+        else:
+            if len(pending) >= self.max_per_channel:
+                pending.popitem(last=False)
+                self.dropped.inc()
+            elif pending:
+                self.merged.inc()
+            pending[member.id] = entry
+        
+        self._channels[channel.id] = channel
+        if channel.id not in self._tasks:
+            self._tasks[channel.id] = asyncio.create_task(self._drain(channel.id))
+    
+    async def stop(self, timeout: float = 5.0):
+        self._closed = True
+        self._flush.set()
+        tasks = list(self._tasks.values())
+        if tasks:
+            _, running = await asyncio.wait(tasks, timeout=timeout)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+    
+    async def _pause(self, delay: float):
+        try:
+            await asyncio.wait_for(self._flush.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _drain(self, channel_id: int):
+        pending = self._pending[channel_id]
+        try:
+            # Each channel has one drain task, so sends to a channel never
+            # overlap and stay inside its 5-per-5s message bucket.
+            await self._pause(self.window)
+            while pending:
+                batch = []
+                while pending and len(batch) < self.max_batch:
+                    batch.append(pending.popitem(last=False)[1])
+                
+                async with self._sends:
+                    await self._send(self._channels[channel_id], batch)
+                
+                if pending:
+                    await self._pause(self.send_interval)
+        finally:
+            del self._tasks[channel_id]
+            del self._pending[channel_id]
+            del self._channels[channel_id]
+    
+    async def _send(self, channel: discord.abc.Messageable, batch: List[LevelUp]):
+        try:
+            await channel.send(embed=build_announcement_embed(batch))
+            self.sent.inc()
+        except discord.HTTPException as e:
+            count_error("announcement")
+            print(f"Error sending level up announcement: {e}")
+
+def build_announcement_embed(batch: List[LevelUp]) -> discord.Embed:
+    if len(batch) == 1:
+        entry = batch[0]
+        embed = discord.Embed(
+            title="🎉 Level Up!",
+            description=f"{entry.member.mention} has reached **Level {entry.level}**!",
+            color=0x00ff00
+        )
+        
+        embed.add_field(
+            name="Total XP",
+            value=f"{entry.total_xp:,}",
+            inline=True
+        )
+        
+        embed.add_field(
+            name="Messages Sent",
+            value=f"{entry.total_messages:,}",
+            inline=True
+        )
+        
+        embed.set_thumbnail(url=entry.member.display_avatar.url)
+        return embed
+    
+    lines = [
+        f"{entry.member.mention} reached **Level {entry.level}** ({entry.total_xp:,} XP)"
+        for entry in sorted(batch, key=lambda entry: -entry.level)
+    ]
+    return discord.Embed(
+        title="🎉 Level Ups!",
+        description="\n".join(lines),
+        color=0x00ff00
+    )
@@ -0,0 +1,196 @@
+import asyncio
+import time
+import discord
+from typing import Dict, Optional
+from .roles import reconcile_member_roles
+from .metrics import count_error
+
+class RoleBackfill:
+    def __init__(self, bot, chunk_size: int = 500, edit_interval: float = 0.5, report_interval: float = 10.0):
+        self.bot = bot
+        self.chunk_size = chunk_size
+        self.edit_interval = edit_interval
+        self.report_interval = report_interval
+        self.jobs: Dict[int, dict] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+    
+    async def resume(self):
+        # Every cluster process shares the job table, but only the process
+        # running a guild's shard can see its members.
+        for job in await self.bot.db.get_backfill_jobs():
+            if job['guild_id'] not in self.jobs and self._owns(job['guild_id']):
+                self._start(job)
+    
+    def _owns(self, guild_id: int) -> bool:
+        shard_ids = self.bot.shard_ids
+        if shard_ids is None:
+            return True
+        return (guild_id >> 22) % self.bot.shard_count in shard_ids
+    
+    async def schedule(self, guild: discord.Guild, channel: Optional[discord.abc.Messageable] = None) -> dict:
+        job = self.jobs.get(guild.id)
+        if job is not None:
+            # Role thresholds changed under a running job; start it over so
+            # members already visited are checked against the new config.
+            job['restart'] = True
+            return job
+        
+        job = {
+            'guild_id': guild.id,
+            'last_user_id': 0,
+            'processed': 0,
+            'updated': 0,
+            'channel_id': None,
+            'message_id': None,
+            'started_at': time.time()
+        }
+        
+        if channel is not None:
+            total = await self.bot.db.count_ranked_users(guild.id)
+            message = await channel.send(embed=self._progress_embed(job, total))
+            job['channel_id'] = message.channel.id
+            job['message_id'] = message.id
+        
+        await self._checkpoint(job)
+        self._start(job)
+        return job
+    
+    async def stop(self):
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _start(self, job: dict):
+        self.jobs[job['guild_id']] = job
+        self.tasks[job['guild_id']] = asyncio.create_task(self._run(job))
+    
+    async def _checkpoint(self, job: dict):
+        await self.bot.db.save_backfill_job(
+            job['guild_id'], job['last_user_id'], job['processed'], job['updated'],
+            job['channel_id'], job['message_id'], job['started_at']
+        )
+    
+    async def _run(self, job: dict):
+        await self.bot.wait_until_ready()
+        guild_id = job['guild_id']
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.chunk_size)
+        worker = None
+        
+        try:
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                # Once ready, a guild missing from its own shard's cache is
+                # one the bot has left.
+                if self._owns(guild_id):
+                    await self.bot.db.delete_backfill_job(guild_id)
+                return
+            
+            worker = asyncio.create_task(self._apply_edits(queue, job))
+            last_report = time.monotonic()
+            
+            while True:
+                if job.pop('restart', False):
+                    job['last_user_id'] = 0
+                    job['processed'] = 0
+                
+                config = await self.bot.db.get_guild_config(guild_id)
+                chunk = await self.bot.db.get_level_chunk(guild_id, job['last_user_id'], self.chunk_size)
+                if not chunk:
+                    break
+                
+                for i, (user_id, level) in enumerate(chunk):
+                    member = guild.get_member(user_id)
+                    if member is not None and not member.bot:
+                        if reconcile_member_roles(member, config.level_roles, level) is not None:
+                            await queue.put(member)
+                    if i % 100 == 99:
+                        await asyncio.sleep(0)
+                
+                # Only advance the checkpoint once every edit from the chunk
+                # has been applied, so a restart never skips a member.
+                await queue.join()
+                job['last_user_id'] = chunk[-1][0]
+                job['processed'] += len(chunk)
+                await self._checkpoint(job)
+                
+                if time.monotonic() - last_report >= self.report_interval:
+                    last_report = time.monotonic()
+                    await self._report(job)
+            
+            await self.bot.db.delete_backfill_job(guild_id)
+            await self._report(job, done=True)
+        
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            count_error("role_backfill")
+            print(f"Error backfilling level roles: {e}")
+        finally:
+            if worker is not None:
+                worker.cancel()
+            self.jobs.pop(guild_id, None)
+            self.tasks.pop(guild_id, None)
+    
+    async def _apply_edits(self, queue: asyncio.Queue, job: dict):
+        while True:
+            member = await queue.get()
+            try:
+                # Re-check right before editing: the member may have levelled
+                # up, or had roles changed, since the chunk was scanned.
+                data = await self.bot.db.get_user_data(member.id, member.guild.id)
+                config = await self.bot.db.get_guild_config(member.guild.id)
+                level = self.bot.leveling.calculate_level_from_xp(data['xp'], config.xp_curve)
+                
+                roles = reconcile_member_roles(member, config.level_roles, level)
+                if roles is not None:
+                    await member.edit(roles=roles, reason="Level role backfill")
+                    job['updated'] += 1
+                    # Leave room in the guild's member-edit bucket for live
+                    # level-ups instead of spending it all on the backfill.
+                    await asyncio.sleep(self.edit_interval)
+            
+            except discord.Forbidden:
+                pass
+            except Exception as e:
+                # The worker must outlive any one member, or the scanner
+                # would wait on queue.join() forever.
+                count_error("role_backfill")
+                print(f"Error applying backfilled roles: {e}")
+            finally:
+                queue.task_done()
+    
+    def _progress_embed(self, job: dict, total: int, done: bool = False) -> discord.Embed:
+        embed = discord.Embed(
+            title="✅ Level Roles Synced" if done else "🔄 Syncing Level Roles",
+            color=0x00ff00 if done else 0x3498db
+        )
+        
+        embed.add_field(
+            name="Members Checked",
+            value=f"{job['processed']:,} / {max(total, job['processed']):,}",
+            inline=True
+        )
+        
+        embed.add_field(
+            name="Roles Updated",
+            value=f"{job['updated']:,}",
+            inline=True
+        )
+        
+        return embed
+    
+    async def _report(self, job: dict, done: bool = False):
+        if not job['channel_id'] or not job['message_id']:
+            return
+        
+        channel = self.bot.get_channel(job['channel_id'])
+        if channel is None:
+            return
+        
+        try:
+            total = await self.bot.db.count_ranked_users(job['guild_id'])
+            message = channel.get_partial_message(job['message_id'])
+            await message.edit(embed=self._progress_embed(job, total, done))
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,66 @@
+from typing import Dict, List, Optional, Tuple
+
+class PendingXP:
+    __slots__ = ('xp', 'level', 'total_messages', 'last_message_time', 'xp_delta', 'message_delta')
+    
+    def __init__(self, xp: int, level: int, total_messages: int, last_message_time: float):
+        self.xp = xp
+        self.level = level
+        self.total_messages = total_messages
+        self.last_message_time = last_message_time
+        self.xp_delta = 0
+        self.message_delta = 0
+    
+    def as_dict(self) -> dict:
+        return {
+            'xp': self.xp,
+            'level': self.level,
+            'total_messages': self.total_messages,
+            'last_message_time': self.last_message_time
+        }
+
+class XPBuffer:
+    def __init__(self, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self.pending: Dict[Tuple[int, int], PendingXP] = {}
+    
+    def __len__(self) -> int:
+        return len(self.pending)
+    
+    @property
+    def full(self) -> bool:
+        return len(self.pending) >= self.max_pending
+    
+    def get(self, user_id: int, guild_id: int) -> Optional[PendingXP]:
+        return self.pending.get((user_id, guild_id))
+    
+    def track(self, user_id: int, guild_id: int, data: dict) -> PendingXP:
+        key = (user_id, guild_id)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = PendingXP(data['xp'], data['level'], data['total_messages'], data['last_message_time'])
+            self.pending[key] = entry
+        return entry
+    
+    def discard(self, user_id: int, guild_id: int):
+        self.pending.pop((user_id, guild_id), None)
+    
+    def snapshot(self) -> List[tuple]:
+        return [
+            (user_id, guild_id, entry.xp_delta, entry.message_delta, entry.last_message_time)
+            for (user_id, guild_id), entry in self.pending.items()
+            if entry.xp_delta or entry.message_delta
+        ]
+    
+    def settle(self, rows: List[tuple]):
+        # Entries may have gained more XP while the flush was awaiting the
+        # database, so only the flushed part of each delta is subtracted.
+        for user_id, guild_id, xp_delta, message_delta, _ in rows:
+            key = (user_id, guild_id)
+            entry = self.pending.get(key)
+            if entry is None:
+                continue
+            entry.xp_delta -= xp_delta
+            entry.message_delta -= message_delta
+            if not entry.xp_delta and not entry.message_delta:
+                del self.pending[key]
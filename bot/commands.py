@@ -2,12 +2,31 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import json
-from .utils import create_progress_bar
+import time
+from .utils import create_level_histogram, create_progress_bar, format_number
+from .curves import parse_thresholds
+from .journal import SOURCE_SET
+from .metrics import (CONFIG_CACHE_HITS, CONFIG_CACHE_MISSES, LEVEL_UPS, MESSAGES_COOLDOWN, MESSAGES_REPEATED,
+                      MESSAGES_REWARDED, MESSAGES_SEEN, PERIOD_WINDOW_HITS, PERIOD_WINDOW_MISSES, RANK_INDEX_HITS,
+                      RANK_INDEX_MISSES, metrics)
+from .views import LEADERBOARD_PAGE_SIZE, LEADERBOARD_PERIODS, build_leaderboard_embed, build_leaderboard_view
 
 class LevelCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
     
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras['started'] = time.perf_counter()
+        return True
+    
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        started = interaction.extras.get('started')
+        if started is not None:
+            metrics.histogram(
+                "levelbot_command_seconds", "Slash command latency", command=command.qualified_name
+            ).observe(time.perf_counter() - started)
+    
     @app_commands.command(name="rank", description="Check your current level and XP")
     @app_commands.describe(user="User to check rank for (optional)")
     async def rank(self, interaction: discord.Interaction, user: discord.Member = None):
@@ -18,9 +37,13 @@ class LevelCommands(commands.Cog):
             return
         
         try:
+            await interaction.response.defer(thinking=True)
             user_data = await self.bot.db.get_user_data(target_user.id, interaction.guild.id)
             rank = await self.bot.db.get_user_rank(target_user.id, interaction.guild.id)
-            progress = self.bot.leveling.format_xp_progress(user_data['xp'])
+            config = await self.bot.db.get_guild_config(interaction.guild.id)
+            progress = self.bot.leveling.format_xp_progress(user_data['xp'], config.xp_curve)
+            first_rank, nearby = await self.bot.db.get_users_around(target_user.id, interaction.guild.id)
+            names = await self.bot.names.resolve(interaction.guild, [row[0] for row in nearby])
             
             embed = discord.Embed(
                 title=f"📊 {target_user.display_name}'s Stats",
@@ -65,59 +88,99 @@ class LevelCommands(commands.Cog):
                 inline=False
             )
             
-            await interaction.response.send_message(embed=embed)
+            if nearby:
+                lines = []
+                for position, (user_id, xp, level, messages) in enumerate(nearby, start=first_rank):
+                    name = names.get(user_id, f"User {user_id}")
+                    if user_id == target_user.id:
+                        name = f"**{name}**"
+                    lines.append(f"#{position} {name} • Level {level} • {xp:,} XP")
+                embed.add_field(
+                    name="Nearby",
+                    value="\n".join(lines),
+                    inline=False
+                )
+            
+            await interaction.followup.send(embed=embed)
             
         except Exception as e:
-            await interaction.response.send_message("An error occurred while fetching rank data.", ephemeral=True)
+            await interaction.followup.send("An error occurred while fetching rank data.", ephemeral=True)
     
     @app_commands.command(name="leaderboard", description="View the server leaderboard")
-    @app_commands.describe(page="Page number (optional)")
-    async def leaderboard(self, interaction: discord.Interaction, page: int = 1):
+    @app_commands.describe(page="Page number (optional)", period="Rank by XP earned in this period (optional)")
+    @app_commands.choices(period=[
+        app_commands.Choice(name="all time", value="all"),
+        app_commands.Choice(name="week", value="week"),
+        app_commands.Choice(name="month", value="month")
+    ])
+    async def leaderboard(self, interaction: discord.Interaction, page: int = 1, period: str = "all"):
         try:
+            await interaction.response.defer(thinking=True)
             page = max(1, page)
-            limit = 10
+            limit = LEADERBOARD_PAGE_SIZE
             offset = (page - 1) * limit
             
-            leaderboard_data = await self.bot.db.get_leaderboard(interaction.guild.id, limit + offset)
-            
-            if not leaderboard_data:
-                await interaction.response.send_message("No users found in the leaderboard!", ephemeral=True)
+            if period in LEADERBOARD_PERIODS:
+                days = LEADERBOARD_PERIODS[period][1]
+                total_users = await self.bot.db.count_period_users(interaction.guild.id, days)
+                page_data = await self.bot.db.get_period_leaderboard(interaction.guild.id, days, limit, offset)
+            else:
+                period = None
+                total_users = await self.bot.db.count_ranked_users(interaction.guild.id)
+                page_data = await self.bot.db.get_leaderboard(interaction.guild.id, limit, offset)
+            
+            if not page_data:
+                await interaction.followup.send("No users found in the leaderboard!", ephemeral=True)
                 return
             
-            page_data = leaderboard_data[offset:offset + limit]
+            total_pages = (total_users + limit - 1) // limit
             
-            embed = discord.Embed(
-                title=f"🏆 Server Leaderboard - Page {page}",
-                color=0xffd700
+            names = await self.bot.names.resolve(interaction.guild, [row[0] for row in page_data])
+            await interaction.followup.send(
+                embed=build_leaderboard_embed(page, total_pages, page_data, names, period),
+                view=build_leaderboard_view(page, total_pages, page_data, period)
             )
             
-            description = ""
-            for i, (user_id, xp, level, messages) in enumerate(page_data, start=offset + 1):
-                user = self.bot.get_user(user_id)
-                username = user.display_name if user else f"User {user_id}"
-                
-                medal = ""
-                if i == 1:
-                    medal = "🥇"
-                elif i == 2:
-                    medal = "🥈"
-                elif i == 3:
-                    medal = "🥉"
-                else:
-                    medal = f"**{i}.**"
-                
-                description += f"{medal} {username}\n"
-                description += f"Level {level} • {xp:,} XP • {messages:,} messages\n\n"
+        except Exception as e:
+            await interaction.followup.send("An error occurred while fetching leaderboard data.", ephemeral=True)
+    
+    @app_commands.command(name="serverstats", description="View leveling statistics for this server")
+    async def server_stats(self, interaction: discord.Interaction):
+        try:
+            await interaction.response.defer(thinking=True)
+            guild_id = interaction.guild.id
+            stats = await self.bot.db.get_guild_stats(guild_id)
+            active = await self.bot.db.count_period_users(guild_id, 7)
+            movers = await self.bot.db.get_period_leaderboard(guild_id, 7, 5)
             
-            embed.description = description
+            embed = discord.Embed(
+                title=f"📊 {interaction.guild.name} Statistics",
+                color=0x0099ff
+            )
             
-            total_pages = (len(leaderboard_data) + limit - 1) // limit
-            embed.set_footer(text=f"Page {page} of {total_pages}")
+            embed.add_field(name="Total XP", value=format_number(stats['total_xp']), inline=True)
+            embed.add_field(name="Members Ranked", value=f"{stats['members']:,}", inline=True)
+            embed.add_field(name="Messages", value=format_number(stats['total_messages']), inline=True)
+            embed.add_field(name="Active This Week", value=f"{active:,}", inline=True)
             
-            await interaction.response.send_message(embed=embed)
+            embed.add_field(
+                name="Level Distribution",
+                value=create_level_histogram(stats['levels'])[:1024] or "No members yet",
+                inline=False
+            )
+            
+            if movers:
+                names = await self.bot.names.resolve(interaction.guild, [row[0] for row in movers])
+                lines = [
+                    f"**{index}.** {names.get(user_id, f'User {user_id}')} +{period_xp:,} XP (Level {level})"
+                    for index, (user_id, period_xp, level, _) in enumerate(movers, 1)
+                ]
+                embed.add_field(name="Top Movers This Week", value="\n".join(lines), inline=False)
             
+            await interaction.followup.send(embed=embed)
+        
         except Exception as e:
-            await interaction.response.send_message("An error occurred while fetching leaderboard data.", ephemeral=True)
+            await interaction.followup.send("An error occurred while fetching server statistics.", ephemeral=True)
     
     @app_commands.command(name="addxp", description="Add XP to a user (Admin only)")
     @app_commands.describe(user="User to add XP to", amount="Amount of XP to add")
@@ -132,12 +195,10 @@ class LevelCommands(commands.Cog):
             return
         
         try:
-            old_data = await self.bot.db.get_user_data(user.id, interaction.guild.id)
-            await self.bot.db.add_xp(user.id, interaction.guild.id, amount)
-            new_data = await self.bot.db.get_user_data(user.id, interaction.guild.id)
+            old_data, new_data = await self.bot.db.add_xp(user.id, interaction.guild.id, amount, interaction.user.id)
             
-            old_level = self.bot.leveling.calculate_level_from_xp(old_data['xp'])
-            new_level = self.bot.leveling.calculate_level_from_xp(new_data['xp'])
+            old_level = old_data['level']
+            new_level = new_data['level']
             
             embed = discord.Embed(
                 title="✅ XP Added",
@@ -181,8 +242,8 @@ class LevelCommands(commands.Cog):
             return
         
         try:
-            await self.bot.db.set_xp(user.id, interaction.guild.id, amount)
-            new_level = self.bot.leveling.calculate_level_from_xp(amount)
+            _, new_data = await self.bot.db.set_xp(user.id, interaction.guild.id, amount, interaction.user.id)
+            new_level = new_data['level']
             
             embed = discord.Embed(
                 title="✅ XP Set",
@@ -201,41 +262,78 @@ class LevelCommands(commands.Cog):
         except Exception as e:
             await interaction.response.send_message("An error occurred while setting XP.", ephemeral=True)
     
+    @app_commands.command(name="xpaudit", description="Show recent admin XP changes (Admin only)")
+    @app_commands.describe(user="Only show changes to this user")
+    @app_commands.default_permissions(administrator=True)
+    async def xp_audit(self, interaction: discord.Interaction, user: discord.Member = None):
+        try:
+            rows = await self.bot.db.get_xp_audit(interaction.guild.id, user.id if user else None)
+            
+            embed = discord.Embed(
+                title="📜 XP Audit Log",
+                color=0x0099ff
+            )
+            
+            if not rows:
+                embed.description = "No admin XP changes recorded."
+            else:
+                lines = []
+                for _, user_id, actor_id, source, amount, timestamp in rows:
+                    if source == SOURCE_SET:
+                        change = f"set <@{user_id}>'s XP to {amount:,}"
+                    else:
+                        change = f"added {amount:,} XP to <@{user_id}>"
+                    lines.append(f"<t:{int(timestamp)}:R> <@{actor_id}> {change}")
+                embed.description = "\n".join(lines)
+            
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        
+        except Exception as e:
+            await interaction.response.send_message("An error occurred while fetching the audit log.", ephemeral=True)
+    
     @app_commands.command(name="config", description="Configure leveling system (Admin only)")
     @app_commands.describe(
         xp_per_message="XP awarded per message",
         cooldown="Cooldown between XP awards (seconds)",
         announcement_channel="Channel for level up announcements",
-        announcements="Enable/disable level up announcements"
+        announcements="Enable/disable level up announcements",
+        voice_xp="XP awarded per minute in voice (0 to disable)"
     )
     @app_commands.default_permissions(administrator=True)
     async def config(self, interaction: discord.Interaction, 
                     xp_per_message: int = None,
                     cooldown: int = None,
                     announcement_channel: discord.TextChannel = None,
-                    announcements: bool = None):
+                    announcements: bool = None,
+                    voice_xp: int = None):
         try:
-            config = await self.bot.db.get_guild_config(interaction.guild.id)
+            changes = {}
             
             if xp_per_message is not None:
                 if xp_per_message <= 0 or xp_per_message > 100:
                     await interaction.response.send_message("XP per message must be between 1 and 100!", ephemeral=True)
                     return
-                config['xp_per_message'] = xp_per_message
+                changes['xp_per_message'] = xp_per_message
             
             if cooldown is not None:
                 if cooldown < 0 or cooldown > 3600:
                     await interaction.response.send_message("Cooldown must be between 0 and 3600 seconds!", ephemeral=True)
                     return
-                config['xp_cooldown'] = cooldown
+                changes['xp_cooldown'] = cooldown
             
             if announcement_channel is not None:
-                config['level_up_channel'] = announcement_channel.id
+                changes['level_up_channel'] = announcement_channel.id
             
             if announcements is not None:
-                config['announcement_enabled'] = 1 if announcements else 0
+                changes['announcement_enabled'] = 1 if announcements else 0
             
-            await self.bot.db.update_guild_config(interaction.guild.id, **config)
+            if voice_xp is not None:
+                if voice_xp < 0 or voice_xp > 100:
+                    await interaction.response.send_message("Voice XP must be between 0 and 100 per minute!", ephemeral=True)
+                    return
+                changes['voice_xp'] = voice_xp
+            
+            config = await self.bot.db.update_guild_config(interaction.guild.id, **changes)
             
             embed = discord.Embed(
                 title="⚙️ Configuration Updated",
@@ -244,19 +342,19 @@ class LevelCommands(commands.Cog):
             
             embed.add_field(
                 name="XP per Message",
-                value=str(config['xp_per_message']),
+                value=str(config.xp_per_message),
                 inline=True
             )
             
             embed.add_field(
                 name="Cooldown",
-                value=f"{config['xp_cooldown']}s",
+                value=f"{config.xp_cooldown}s",
                 inline=True
             )
             
             channel_name = "Current Channel"
-            if config['level_up_channel']:
-                channel = self.bot.get_channel(config['level_up_channel'])
+            if config.level_up_channel:
+                channel = self.bot.get_channel(config.level_up_channel)
                 if channel:
                     channel_name = channel.mention
             
@@ -268,7 +366,13 @@ class LevelCommands(commands.Cog):
             
             embed.add_field(
                 name="Announcements",
-                value="Enabled" if config['announcement_enabled'] else "Disabled",
+                value="Enabled" if config.announcement_enabled else "Disabled",
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Voice XP",
+                value=f"{config.voice_xp}/min" if config.voice_xp else "Disabled",
                 inline=True
             )
             
@@ -286,7 +390,8 @@ class LevelCommands(commands.Cog):
     @app_commands.choices(action=[
         app_commands.Choice(name="add", value="add"),
         app_commands.Choice(name="remove", value="remove"),
-        app_commands.Choice(name="list", value="list")
+        app_commands.Choice(name="list", value="list"),
+        app_commands.Choice(name="sync", value="sync")
     ])
     @app_commands.default_permissions(administrator=True)
     async def level_role(self, interaction: discord.Interaction, 
@@ -305,10 +410,10 @@ class LevelCommands(commands.Cog):
                 )
                 
                 description = ""
-                for level_str, role_id in sorted(level_roles.items(), key=lambda x: int(x[0])):
+                for role_level, role_id in level_roles.items():
                     role_obj = interaction.guild.get_role(role_id)
                     role_name = role_obj.mention if role_obj else f"Deleted Role ({role_id})"
-                    description += f"Level {level_str}: {role_name}\n"
+                    description += f"Level {role_level}: {role_name}\n"
                 
                 embed.description = description
                 await interaction.response.send_message(embed=embed)
@@ -331,6 +436,7 @@ class LevelCommands(commands.Cog):
                 )
                 
                 await interaction.response.send_message(embed=embed)
+                await self.schedule_role_backfill(interaction)
                 
             elif action == "remove":
                 if level is None:
@@ -346,6 +452,203 @@ class LevelCommands(commands.Cog):
                 )
                 
                 await interaction.response.send_message(embed=embed)
+                await self.schedule_role_backfill(interaction)
+            
+            elif action == "sync":
+                await interaction.response.send_message("Syncing level roles for existing members...", ephemeral=True)
+                await self.schedule_role_backfill(interaction)
                 
         except Exception as e:
             await interaction.response.send_message("An error occurred while managing level roles.", ephemeral=True)
+    
+    @app_commands.command(name="repairlevels", description="Recompute stored levels from XP (Admin only)")
+    @app_commands.default_permissions(administrator=True)
+    async def repair_levels(self, interaction: discord.Interaction):
+        try:
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            scanned, changed = await self.bot.db.recalculate_levels(interaction.guild.id)
+            
+            embed = discord.Embed(
+                title="🔧 Levels Repaired",
+                description=f"Checked {scanned:,} members and corrected {changed:,} stored levels.",
+                color=0x00ff00
+            )
+            
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            
+            if changed:
+                level_roles = await self.bot.leveling.get_level_roles(interaction.guild.id)
+                if level_roles:
+                    await self.schedule_role_backfill(interaction)
+        
+        except Exception as e:
+            await interaction.followup.send("An error occurred while repairing levels.", ephemeral=True)
+    
+    @app_commands.command(name="xpcurve", description="Show or change the XP curve (Admin only)")
+    @app_commands.describe(
+        curve="Curve type",
+        factor="Quadratic: XP for level n is factor × n²",
+        base="Exponential: XP needed for level 1",
+        growth="Exponential: percent of the previous level's cost each level needs (e.g. 110)",
+        thresholds="Table: total XP for levels 1, 2, 3, ... separated by commas"
+    )
+    @app_commands.choices(curve=[
+        app_commands.Choice(name="show", value="show"),
+        app_commands.Choice(name="quadratic", value="quadratic"),
+        app_commands.Choice(name="exponential", value="exponential"),
+        app_commands.Choice(name="mee6", value="mee6"),
+        app_commands.Choice(name="table", value="table")
+    ])
+    @app_commands.default_permissions(administrator=True)
+    async def xp_curve(self, interaction: discord.Interaction, curve: str,
+                       factor: int = None, base: int = None, growth: int = None, thresholds: str = None):
+        try:
+            if curve == "show":
+                xp_curve = (await self.bot.db.get_guild_config(interaction.guild.id)).xp_curve
+            else:
+                spec = {'type': curve}
+                if factor is not None:
+                    spec['factor'] = factor
+                if base is not None:
+                    spec['base'] = base
+                if growth is not None:
+                    spec['growth'] = growth
+                if curve == "table":
+                    spec['levels'] = parse_thresholds(thresholds or "")
+                    if not spec['levels']:
+                        await interaction.response.send_message("Thresholds must be a list of whole numbers!", ephemeral=True)
+                        return
+                
+                try:
+                    xp_curve = await self.bot.leveling.set_xp_curve(interaction.guild.id, spec)
+                except ValueError as e:
+                    await interaction.response.send_message(f"Invalid curve: {e}", ephemeral=True)
+                    return
+            
+            embed = discord.Embed(
+                title="📈 XP Curve",
+                description=xp_curve.describe(),
+                color=0x3498db
+            )
+            
+            embed.add_field(
+                name="Levels",
+                value="\n".join(
+                    f"Level {level}: {xp_curve.xp_for_level(level):,} XP"
+                    for level in (1, 5, 10, 25, 50, 100) if level <= xp_curve.max_level
+                ),
+                inline=False
+            )
+            
+            if curve != "show":
+                embed.set_footer(text="Stored levels are being recalculated in the background.")
+            
+            await interaction.response.send_message(embed=embed)
+            
+            if curve != "show":
+                level_roles = await self.bot.leveling.get_level_roles(interaction.guild.id)
+                if level_roles:
+                    await self.schedule_role_backfill(interaction)
+        
+        except Exception as e:
+            await interaction.response.send_message("An error occurred while updating the XP curve.", ephemeral=True)
+    
+    async def schedule_role_backfill(self, interaction: discord.Interaction):
+        try:
+            await self.bot.role_backfill.schedule(interaction.guild, interaction.channel)
+        except Exception as e:
+            print(f"Error scheduling level role backfill: {e}")
+    
+    @app_commands.command(name="botstats", description="Show bot performance statistics (Admin only)")
+    @app_commands.default_permissions(administrator=True)
+    async def stats(self, interaction: discord.Interaction):
+        try:
+            embed = discord.Embed(
+                title="📈 Bot Statistics",
+                color=0x3498db
+            )
+            
+            embed.add_field(
+                name="Messages",
+                value=(
+                    f"{MESSAGES_SEEN.value:,} seen\n"
+                    f"{MESSAGES_REWARDED.value:,} rewarded\n"
+                    f"{MESSAGES_COOLDOWN.value:,} on cooldown\n"
+                    f"{MESSAGES_REPEATED.value:,} repeats"
+                ),
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Level Ups",
+                value=f"{LEVEL_UPS.value:,}",
+                inline=True
+            )
+            
+            embed.add_field(
+                name="Cache Hit Rate",
+                value=(
+                    f"Guild config: {format_hit_rate(CONFIG_CACHE_HITS.value, CONFIG_CACHE_MISSES.value)}\n"
+                    f"Rank index: {format_hit_rate(RANK_INDEX_HITS.value, RANK_INDEX_MISSES.value)}\n"
+                    f"Period window: {format_hit_rate(PERIOD_WINDOW_HITS.value, PERIOD_WINDOW_MISSES.value)}"
+                ),
+                inline=True
+            )
+            
+            depths = []
+            for name, label in GAUGE_LABELS:
+                value = metrics.read_gauge(name)
+                if value is not None:
+                    depths.append(f"{label}: {int(value):,}")
+            
+            embed.add_field(
+                name="Queues & Caches",
+                value="\n".join(depths) or "None",
+                inline=False
+            )
+            
+            for title, name, label in (
+                ("Database Latency (p50 / p99)", "levelbot_db_seconds", "method"),
+                ("Command Latency (p50 / p99)", "levelbot_command_seconds", "command")
+            ):
+                lines = [
+                    f"`{key}` {format_seconds(h.quantile(0.5))} / {format_seconds(h.quantile(0.99))} ({h.count:,})"
+                    for key, h in metrics.histograms(name, label)
+                ]
+                embed.add_field(
+                    name=title,
+                    value="\n".join(lines)[:1024] or "No samples yet",
+                    inline=False
+                )
+            
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        
+        except Exception as e:
+            await interaction.response.send_message("An error occurred while collecting statistics.", ephemeral=True)
+
+GAUGE_LABELS = (
+    ("levelbot_xp_buffer_pending", "XP buffer"),
+    ("levelbot_cooldowns_tracked", "Cooldowns"),
+    ("levelbot_guild_configs_cached", "Cached guild configs"),
+    ("levelbot_rank_index_members", "Ranked members"),
+    ("levelbot_level_recalculations", "Level recalculations"),
+    ("levelbot_role_backfill_jobs", "Role backfill jobs"),
+    ("levelbot_name_cache_entries", "Cached display names"),
+    ("levelbot_ingest_queue_depth", "Message queue"),
+    ("levelbot_ingest_deferred", "Deferred level-ups"),
+    ("levelbot_announcements_pending", "Pending announcements"),
+    ("levelbot_voice_members", "Members in voice"),
+)
+
+def format_hit_rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{hits / total * 100:.1f}%" if total else "n/a"
+
+def format_seconds(seconds: float) -> str:
+    if seconds == float('inf'):
+        return ">10s"
+    if seconds < 0.001:
+        return f"{seconds * 1_000_000:.0f}µs"
+    if seconds < 1:
+        return f"{seconds * 1000:.1f}ms"
+    return f"{seconds:.2f}s"
@@ -0,0 +1,134 @@
+from typing import Any, Dict, List, Optional, Set
+
+def cooldown_key(user_id: int, guild_id: int) -> int:
+    # Snowflakes fit in 64 bits, so one packed int identifies a member.
+    return (guild_id << 64) | user_id
+
+class CooldownWheel:
+    def __init__(self, resolution: float = 1.0, slots: int = 4096, max_entries: int = 500_000,
+                 linger: float = 0.0):
+        self.resolution = resolution
+        self.slot_count = slots
+        self.max_entries = max_entries
+        # Entries stay tracked for `linger` seconds after their cooldown ends,
+        # together with any state attached to them.
+        self.linger = linger
+        self._expiry: Dict[int, float] = {}
+        self._state: Dict[int, Any] = {}
+        self._slots: List[Optional[Set[int]]] = [None] * slots
+        self._tick: Optional[int] = None
+    
+    def __len__(self) -> int:
+        return len(self._expiry)
+    
+    def __contains__(self, key: int) -> bool:
+        return key in self._expiry
+    
+    def is_cooling(self, key: int, now: float) -> bool:
+        expiry = self._expiry.get(key)
+        return expiry is not None and now < expiry
+    
+    def try_acquire(self, key: int, now: float, period: float) -> bool:
+        self._advance(now)
+        
+        expiry = self._expiry.get(key)
+        if expiry is not None and now < expiry:
+            return False
+        
+        if period <= 0 and not self.linger:
+            return True
+        
+        if expiry is None and len(self._expiry) >= self.max_entries:
+            self._evict_soonest()
+        
+        expiry = now + max(0, period)
+        self._expiry[key] = expiry
+        self._slot_for(expiry + self.linger).add(key)
+        return True
+    
+    def get_state(self, key: int) -> Any:
+        return self._state.get(key)
+    
+    def set_state(self, key: int, value: Any):
+        # State only lives as long as the key's entry in the wheel.
+        if key in self._expiry:
+            self._state[key] = value
+    
+    def remove(self, key: int):
+        self._expiry.pop(key, None)
+        self._state.pop(key, None)
+    
+    def clear(self):
+        self._expiry.clear()
+        self._state.clear()
+        self._slots = [None] * self.slot_count
+        self._tick = None
+    
+    def _index(self, deadline: float) -> int:
+        return int(deadline // self.resolution) % self.slot_count
+    
+    def _slot_for(self, deadline: float) -> Set[int]:
+        index = self._index(deadline)
+        slot = self._slots[index]
+        if slot is None:
+            slot = self._slots[index] = set()
+        return slot
+    
+    def _sweep(self, index: int, now: float):
+        slot = self._slots[index]
+        if slot is None:
+            return
+        
+        self._slots[index] = None
+        survivors = None
+        for key in slot:
+            expiry = self._expiry.get(key)
+            if expiry is None:
+                continue
+            deadline = expiry + self.linger
+            if deadline <= now:
+                del self._expiry[key]
+                self._state.pop(key, None)
+            elif self._index(deadline) != index:
+                # Re-acquired while lingering; the key already sits in the
+                # slot of its new deadline.
+                continue
+            elif survivors is None:
+                survivors = {key}
+            else:
+                survivors.add(key)
+        
+        # Expiries further out than one wheel turn share a slot with nearer
+        # ones; they stay put until a later turn reaches them.
+        if survivors:
+            self._slots[index] = survivors
+    
+    def _advance(self, now: float):
+        tick = int(now // self.resolution)
+        if self._tick is None:
+            self._tick = tick
+            return
+        
+        # Only whole ticks that are fully in the past are swept, so every
+        # key found in them has expired unless it wrapped around the wheel.
+        first = max(self._tick, tick - self.slot_count)
+        for t in range(first, tick):
+            self._sweep(t % self.slot_count, now)
+        self._tick = max(self._tick, tick)
+    
+    def _evict_soonest(self):
+        start = self._tick if self._tick is not None else 0
+        for t in range(start, start + self.slot_count):
+            index = t % self.slot_count
+            slot = self._slots[index]
+            if not slot:
+                continue
+            
+            self._slots[index] = None
+            for key in slot:
+                expiry = self._expiry.get(key)
+                if expiry is not None and self._index(expiry + self.linger) == index:
+                    del self._expiry[key]
+                    self._state.pop(key, None)
+            if len(self._expiry) < self.max_entries:
+                return
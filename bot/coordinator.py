@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from .metrics import metrics, count_error
+
+# One byte per message over a Unix socket: a shard asks for the lease,
+# waits for the grant, writes its transaction and hands the lease back.
+ACQUIRE = b"A"
+GRANTED = b"G"
+RELEASE = b"R"
+
+class WriteLeaseServer:
+    def __init__(self, path: str):
+        self.path = path
+        self.grants = 0
+        self._lease = asyncio.Lock()
+        self._server: Optional[asyncio.AbstractServer] = None
+    
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve, self.path)
+    
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+    
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        holding = False
+        try:
+            while True:
+                command = await reader.readexactly(1)
+                if command == ACQUIRE and not holding:
+                    # asyncio.Lock wakes waiters in order, so shards are
+                    # granted the lease first come, first served.
+                    await self._lease.acquire()
+                    holding = True
+                    self.grants += 1
+                    writer.write(GRANTED)
+                    await writer.drain()
+                elif command == RELEASE and holding:
+                    self._lease.release()
+                    holding = False
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # A shard that dies mid-transaction gives the lease back; SQLite
+            # rolls its unfinished transaction back on its own.
+            if holding:
+                self._lease.release()
+            writer.close()
+
+class WriteLease:
+    def __init__(self, path: str, timeout: float = 30.0, retry_interval: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.held = False
+        self._retry_at = 0.0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self.waited = metrics.histogram("levelbot_write_lease_seconds", "Time spent waiting for the write lease")
+    
+    async def acquire(self):
+        if self._writer is None and time.monotonic() < self._retry_at:
+            return
+        
+        start = time.perf_counter()
+        try:
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+            self._writer.write(ACQUIRE)
+            await self._writer.drain()
+            await asyncio.wait_for(self._reader.readexactly(1), self.timeout)
+            self.held = True
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            # SQLite's own file locking still serialises writers, so a missing
+            # coordinator costs fairness, not correctness.
+            count_error("write_lease")
+            print(f"Write lease unavailable, relying on SQLite locking: {e}")
+            self._disconnect()
+            self._retry_at = time.monotonic() + self.retry_interval
+            return
+        except BaseException:
+            self._disconnect()
+            raise
+        self.waited.observe(time.perf_counter() - start)
+    
+    def release(self):
+        if not self.held:
+            return
+        self.held = False
+        try:
+            self._writer.write(RELEASE)
+        except (OSError, AttributeError) as e:
+            print(f"Error releasing write lease: {e}")
+            self._disconnect()
+    
+    def _disconnect(self):
+        # Closing the connection is what returns a granted lease, so the
+        # server never waits on a client that lost track of it.
+        self.held = False
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+    
+    def close(self):
+        self._disconnect()
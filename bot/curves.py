@@ -0,0 +1,174 @@
+import json
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Union
+
+MAX_LEVEL = 10_000
+MAX_XP = 2 ** 62
+
+class XPCurve:
+    __slots__ = ('spec', 'thresholds')
+    
+    def __init__(self, spec: dict, thresholds: Iterable[int]):
+        self.spec = spec
+        # thresholds[level] is the total XP needed to reach that level.
+        self.thresholds = array('q', thresholds)
+    
+    @property
+    def max_level(self) -> int:
+        return len(self.thresholds) - 1
+    
+    def level_for(self, xp: int) -> int:
+        if xp <= 0:
+            return 0
+        return bisect_right(self.thresholds, xp) - 1
+    
+    def xp_for_level(self, level: int) -> int:
+        return self.thresholds[max(0, min(level, self.max_level))]
+    
+    def progress(self, xp: int) -> dict:
+        level = self.level_for(xp)
+        level_start_xp = self.thresholds[level]
+        if level < self.max_level:
+            next_level_xp = self.thresholds[level + 1]
+        else:
+            next_level_xp = level_start_xp
+        
+        progress_xp = max(0, xp - level_start_xp)
+        needed_xp = next_level_xp - level_start_xp
+        
+        return {
+            'current_level': level,
+            'current_xp': xp,
+            'progress_xp': progress_xp,
+            'needed_xp': needed_xp,
+            'next_level_total_xp': next_level_xp,
+            'percentage': progress_xp * 100 // needed_xp if needed_xp > 0 else 100
+        }
+    
+    def describe(self) -> str:
+        kind = self.spec['type']
+        if kind == "quadratic":
+            return f"Quadratic ({self.spec['factor']:,} × level²)"
+        if kind == "exponential":
+            return f"Exponential ({self.spec['base']:,} XP, +{self.spec['growth'] - 100}% per level)"
+        if kind == "mee6":
+            return "MEE6 compatible"
+        return f"Custom table ({self.max_level} levels)"
+    
+    def to_json(self) -> str:
+        return json.dumps(self.spec, sort_keys=True)
+
+def _capped(thresholds: Iterator[int]) -> Iterator[int]:
+    for level, threshold in enumerate(thresholds):
+        if level > MAX_LEVEL or threshold > MAX_XP:
+            return
+        yield threshold
+
+def _quadratic(factor: int) -> Iterator[int]:
+    level = 0
+    while True:
+        yield factor * level * level
+        level += 1
+
+def _exponential(base: int, growth: int) -> Iterator[int]:
+    # Level n costs base * (growth/100)^(n-1) XP, truncated; kept as an exact
+    # fraction so no float error builds up over thousands of levels.
+    total = 0
+    numerator, denominator = base, 1
+    yield 0
+    while True:
+        total += max(1, numerator // denominator)
+        yield total
+        numerator *= growth
+        denominator *= 100
+
+def _mee6() -> Iterator[int]:
+    total = 0
+    level = 0
+    while True:
+        yield total
+        total += 5 * level * level + 50 * level + 100
+        level += 1
+
+def _table(levels) -> Iterator[int]:
+    previous = 0
+    yield 0
+    for threshold in levels:
+        threshold = int(threshold)
+        if threshold <= previous:
+            raise ValueError("Curve thresholds must be positive and strictly increasing")
+        yield threshold
+        previous = threshold
+
+def normalize_spec(spec: Mapping) -> dict:
+    kind = spec.get('type')
+    if kind == "quadratic":
+        factor = int(spec.get('factor', 100))
+        if factor <= 0:
+            raise ValueError("Quadratic factor must be positive")
+        return {'type': kind, 'factor': factor}
+    if kind == "exponential":
+        base = int(spec.get('base', 100))
+        growth = int(spec.get('growth', 110))
+        if base <= 0 or growth <= 100:
+            raise ValueError("Exponential curves need a positive base and growth above 100%")
+        return {'type': kind, 'base': base, 'growth': growth}
+    if kind == "mee6":
+        return {'type': kind}
+    if kind == "table":
+        levels = [int(threshold) for threshold in spec.get('levels', ())]
+        if levels and levels[0] == 0:
+            levels = levels[1:]
+        if not levels:
+            raise ValueError("Curve table needs at least one threshold")
+        return {'type': kind, 'levels': levels}
+    raise ValueError(f"Unknown XP curve type: {kind}")
+
+_compiled: Dict[str, XPCurve] = {}
+
+def compile_curve(spec: Mapping) -> XPCurve:
+    spec = normalize_spec(spec)
+    key = json.dumps(spec, sort_keys=True)
+    curve = _compiled.get(key)
+    if curve is not None:
+        return curve
+    
+    kind = spec['type']
+    if kind == "quadratic":
+        thresholds = _quadratic(spec['factor'])
+    elif kind == "exponential":
+        thresholds = _exponential(spec['base'], spec['growth'])
+    elif kind == "mee6":
+        thresholds = _mee6()
+    else:
+        thresholds = _table(spec['levels'])
+    
+    # Guilds sharing a spec share one compiled table.
+    curve = _compiled[key] = XPCurve(spec, _capped(thresholds))
+    return curve
+
+DEFAULT_CURVE = compile_curve({'type': "quadratic", 'factor': 100})
+
+def parse_curve(raw: Union[XPCurve, Mapping, str, bytes, None]) -> XPCurve:
+    if isinstance(raw, XPCurve):
+        return raw
+    if not raw:
+        return DEFAULT_CURVE
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            return DEFAULT_CURVE
+    if not isinstance(raw, Mapping):
+        return DEFAULT_CURVE
+    try:
+        return compile_curve(raw)
+    except (TypeError, ValueError):
+        return DEFAULT_CURVE
+
+def parse_thresholds(text: str) -> Optional[list]:
+    try:
+        return [int(part) for part in text.replace(",", " ").split()]
+    except ValueError:
+        return None
@@ -1,56 +1,403 @@
 import sqlite3
 import asyncio
+import json
+import time
 import aiosqlite
-from typing import List, Tuple, Optional
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Tuple, Optional
+from .buffer import XPBuffer
+from .ranking import GuildRankIndex, RankIndex
+from .roles import LevelRoles
+from .curves import DEFAULT_CURVE, XPCurve, compile_curve, parse_curve
+from .recompute import UPDATE_LEVEL, level_changes, scan_cursor, scan_statement
+from .journal import SOURCE_ADD, SOURCE_MESSAGE, SOURCE_SET, SOURCE_VOICE, XPJournal
+from .migrations import MIGRATIONS, apply_migration, run_online_jobs
+from .metrics import (CONFIG_CACHE_HITS, CONFIG_CACHE_MISSES, PERIOD_WINDOW_HITS, PERIOD_WINDOW_MISSES,
+                      RANK_INDEX_HITS, RANK_INDEX_MISSES, count_error, db_timed)
+
+PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Adds to whatever is stored, so concurrent increments never overwrite each
+# other, and recomputes the level from the resulting XP in the same statement.
+UPSERT_XP = '''
+    INSERT INTO user_levels
+    (user_id, guild_id, xp, level, total_messages, last_message_time)
+    VALUES (?1, ?2, ?3, xp_level(?2, ?3), ?4, ?5)
+    ON CONFLICT(user_id, guild_id) DO UPDATE SET
+        xp = xp + excluded.xp,
+        level = xp_level(guild_id, xp + excluded.xp),
+        total_messages = total_messages + excluded.total_messages,
+        last_message_time = MAX(last_message_time, excluded.last_message_time)
+'''
+
+# Per-day XP totals behind the weekly/monthly leaderboards; one row per
+# member per active day, added to in the same transaction as user_levels.
+UPSERT_DAILY = '''
+    INSERT INTO xp_daily (guild_id, day, user_id, xp, messages)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, day, user_id) DO UPDATE SET
+        xp = xp + excluded.xp,
+        messages = messages + excluded.messages
+'''
+
+# Absolute XP from /setxp; the member's message count is left alone.
+SET_XP = '''
+    INSERT INTO user_levels (user_id, guild_id, xp, level)
+    VALUES (?1, ?2, ?3, xp_level(?2, ?3))
+    ON CONFLICT(user_id, guild_id) DO UPDATE SET
+        xp = excluded.xp,
+        level = excluded.level
+'''
+
+# Replaces a member's stored values. An upsert rather than OR REPLACE: a
+# replace deletes the old row without firing the delete trigger behind the
+# guild statistics.
+UPDATE_USER = '''
+    INSERT INTO user_levels
+    (user_id, guild_id, xp, level, total_messages, last_message_time)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, guild_id) DO UPDATE SET
+        xp = excluded.xp,
+        level = excluded.level,
+        total_messages = excluded.total_messages,
+        last_message_time = excluded.last_message_time
+'''
+
+# Every journal numbers its records from 1, so audit rows are keyed on the
+# journal and its sequence number; replay skips rows already recorded.
+INSERT_AUDIT = '''
+    INSERT OR IGNORE INTO xp_audit (journal_id, seq, guild_id, user_id, actor_id, source, amount, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Members whose voice XP totals are read back per query; well below
+# SQLite's bound parameter limit.
+VOICE_READ_CHUNK = 500
+
+def journal_path(db_path: str, journal_id: int = 1) -> str:
+    # Each cluster process keeps its own journal; a single process uses id 1.
+    if journal_id == 1:
+        return f"{db_path}.xpjournal"
+    return f"{db_path}.{journal_id}.xpjournal"
+
+def day_of(timestamp: float) -> int:
+    return int(timestamp // 86400)
+
+class GuildConfig(NamedTuple):
+    xp_per_message: int = 15
+    xp_cooldown: int = 60
+    level_up_channel: Optional[int] = None
+    level_roles: LevelRoles = LevelRoles()
+    announcement_enabled: int = 1
+    xp_curve: XPCurve = DEFAULT_CURVE
+    voice_xp: int = 5
+
+def parse_level_roles(raw) -> LevelRoles:
+    if isinstance(raw, LevelRoles):
+        return raw
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            raw = {}
+    if not isinstance(raw, Mapping):
+        raw = {}
+    return LevelRoles(raw)
 
 class Database:
-    def __init__(self, db_path: str = "levelbot.db"):
+    def __init__(self, db_path: str = "levelbot.db", readers: int = 4, cached_statements: int = 256,
+                 flush_interval: float = 5.0, max_pending: int = 1000,
+                 max_ranked_members: int = 4_000_000, daily_retention: int = 35,
+                 prune_interval: float = 3600.0, journal: bool = True, journal_id: int = 1,
+                 write_lease=None, period_ttl: float = 30.0, max_period_windows: int = 256):
         self.db_path = db_path
+        self.reader_count = max(1, readers)
+        self.cached_statements = cached_statements
+        self.flush_interval = flush_interval
+        self.buffer = XPBuffer(max_pending)
+        self.ranks = RankIndex(max_tracked_members=max_ranked_members)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._write_lock = asyncio.Lock()
+        self.daily_retention = daily_retention
+        self.prune_interval = prune_interval
+        self._flush_task: Optional[asyncio.Task] = None
+        self._prune_task: Optional[asyncio.Task] = None
+        self.migration_task: Optional[asyncio.Task] = None
+        self._guild_configs: Dict[int, GuildConfig] = {}
+        self.period_ttl = period_ttl
+        self.max_period_windows = max_period_windows
+        self._period_windows: 'OrderedDict[Tuple[int, int, int], Tuple[GuildRankIndex, Dict[int, int], float]]' = OrderedDict()
+        self.write_lease = write_lease
+        self.journal_id = journal_id
+        self.journal = XPJournal(journal_path(db_path, journal_id)) if journal and db_path != ":memory:" else None
+        self._journal_seq = 0
         
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        # sqlite3 keeps an LRU of compiled statements per connection, so
+        # long-lived connections reuse prepared statements across calls.
+        db = await aiosqlite.connect(self.db_path, cached_statements=self.cached_statements)
+        for pragma in PRAGMAS:
+            await db.execute(pragma)
+        if read_only:
+            await db.execute("PRAGMA query_only = ON")
+        return db
+    
+    @asynccontextmanager
+    async def _read(self):
+        db = await self._idle_readers.get()
+        try:
+            yield db
+        finally:
+            self._idle_readers.put_nowait(db)
+    
+    @asynccontextmanager
+    async def _write(self):
+        async with self._write_lock:
+            # In cluster mode the lease makes this process the only writer
+            # to the file for the length of the transaction.
+            if self.write_lease is not None:
+                await self.write_lease.acquire()
+            try:
+                try:
+                    yield self._writer
+                except BaseException:
+                    await self._writer.rollback()
+                    raise
+                await self._writer.commit()
+            finally:
+                if self.write_lease is not None:
+                    self.write_lease.release()
+    
     async def initialize(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS user_levels (
-                    user_id INTEGER,
-                    guild_id INTEGER,
-                    xp INTEGER DEFAULT 0,
-                    level INTEGER DEFAULT 0,
-                    total_messages INTEGER DEFAULT 0,
-                    last_message_time REAL DEFAULT 0,
-                    PRIMARY KEY (user_id, guild_id)
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS guild_config (
-                    guild_id INTEGER PRIMARY KEY,
-                    xp_per_message INTEGER DEFAULT 15,
-                    xp_cooldown INTEGER DEFAULT 60,
-                    level_up_channel INTEGER,
-                    level_roles TEXT DEFAULT '{}',
-                    announcement_enabled INTEGER DEFAULT 1
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE INDEX IF NOT EXISTS idx_user_guild ON user_levels(user_id, guild_id)
-            ''')
-            
-            await db.execute('''
-                CREATE INDEX IF NOT EXISTS idx_guild_xp ON user_levels(guild_id, xp DESC)
-            ''')
+        if self._writer is not None:
+            return
+        
+        self._writer = await self._connect()
+        await self._writer.execute("PRAGMA journal_mode = WAL")
+        await self._writer.create_function("xp_level", 2, self.level_for)
+        
+        for migration in MIGRATIONS:
+            async with self._write() as db:
+                if await apply_migration(db, migration):
+                    print(f"Applied schema migration {migration.version}: {migration.description}")
+        
+        async with self._write() as db:
+            await db.execute('INSERT OR IGNORE INTO journal_state (id, last_seq) VALUES (?, 0)', (self.journal_id,))
+        
+        self._idle_readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            reader = await self._connect(read_only=True)
+            self._readers.append(reader)
+            self._idle_readers.put_nowait(reader)
+        
+        if self.journal is not None:
+            await self._replay_journal()
+            self.journal.start()
+        
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        self._prune_task = asyncio.create_task(self._prune_loop())
+        self.migration_task = asyncio.create_task(self._online_migration_loop())
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                count_error("flush")
+                print(f"Error flushing XP buffer: {e}")
+    
+    async def run_online_migrations(self, chunk_size: int = 5000, pause: float = 0.05) -> int:
+        return await run_online_jobs(self._write, chunk_size, pause)
+    
+    async def _online_migration_loop(self):
+        try:
+            await self.run_online_migrations()
+        except Exception as e:
+            count_error("migration")
+            print(f"Error running online migration: {e}")
+    
+    async def _prune_loop(self):
+        while True:
+            try:
+                await self.prune_daily()
+            except Exception as e:
+                count_error("prune")
+                print(f"Error pruning daily XP buckets: {e}")
+            await asyncio.sleep(self.prune_interval)
+    
+    @db_timed("prune_daily")
+    async def prune_daily(self) -> int:
+        cutoff = day_of(time.time()) - self.daily_retention
+        async with self._read() as db:
+            async with db.execute('SELECT DISTINCT guild_id FROM xp_daily') as cursor:
+                guild_ids = [row[0] for row in await cursor.fetchall()]
+        
+        # One short transaction per guild, each a range delete on the
+        # (guild_id, day) key prefix, so the writer is never held for long.
+        removed = 0
+        for guild_id in guild_ids:
+            async with self._write() as db:
+                cursor = await db.execute('''
+                    DELETE FROM xp_daily WHERE guild_id = ? AND day < ?
+                ''', (guild_id, cutoff))
+                removed += cursor.rowcount
+                await cursor.close()
+        return removed
+    
+    async def _replay_journal(self):
+        async with self._read() as db:
+            async with db.execute('SELECT last_seq FROM journal_state WHERE id = ?', (self.journal_id,)) as cursor:
+                self._journal_seq = (await cursor.fetchone())[0]
+        
+        events = self.journal.open(self._journal_seq)
+        if not events:
+            return
+        
+        # Everything up to last_seq is already in user_levels; the rest is
+        # applied in journal order in a single transaction.
+        await self._load_curves(event.guild_id for event in events)
+        async with self._write() as db:
+            for event in events:
+                if event.source == SOURCE_MESSAGE:
+                    await db.execute(UPSERT_XP, (event.user_id, event.guild_id, event.amount, 1, event.timestamp))
+                    await db.execute(UPSERT_DAILY, (
+                        event.guild_id, day_of(event.timestamp), event.user_id, event.amount, 1
+                    ))
+                    continue
+                
+                if event.source == SOURCE_VOICE:
+                    await db.execute(UPSERT_XP, (event.user_id, event.guild_id, event.amount, 0, 0))
+                    await db.execute(UPSERT_DAILY, (
+                        event.guild_id, day_of(event.timestamp), event.user_id, event.amount, 0
+                    ))
+                    continue
+                
+                if event.source == SOURCE_SET:
+                    await db.execute(SET_XP, (event.user_id, event.guild_id, event.amount))
+                else:
+                    await db.execute(UPSERT_XP, (event.user_id, event.guild_id, event.amount, 0, 0))
+                await db.execute(INSERT_AUDIT, (
+                    self.journal_id, event.seq, event.guild_id, event.user_id, event.actor_id,
+                    event.source, event.amount, event.timestamp
+                ))
             
-            await db.commit()
+            await db.execute('UPDATE journal_state SET last_seq = ? WHERE id = ?', (events[-1].seq, self.journal_id))
+        
+        self._journal_seq = events[-1].seq
+        print(f"Replayed {len(events)} XP journal events")
+    
+    def _journal_append(self, user_id: int, guild_id: int, amount: int, timestamp: float,
+                        source: int = SOURCE_MESSAGE, actor_id: int = 0) -> Optional[int]:
+        # Without a journal there is no sequence number; a NULL seq keeps
+        # each audit row distinct.
+        if self.journal is None:
+            return None
+        return self.journal.append(guild_id, user_id, amount, timestamp, source, actor_id)
+    
+    async def _write_pending(self, db) -> Tuple[List[tuple], int]:
+        # Runs with the write lock held. The snapshot and the journal position
+        # are taken together, so last_seq never covers an unwritten event.
+        rows = self.buffer.snapshot()
+        seq = self.journal.seq if self.journal is not None else 0
+        
+        if rows:
+            await self._load_curves(guild_id for _, guild_id, *_ in rows)
+            await db.executemany(UPSERT_XP, rows)
+            await db.executemany(UPSERT_DAILY, [
+                (guild_id, day_of(last_time), user_id, xp_delta, message_delta)
+                for user_id, guild_id, xp_delta, message_delta, last_time in rows
+            ])
+        if seq > self._journal_seq:
+            await db.execute('UPDATE journal_state SET last_seq = ? WHERE id = ?', (seq, self.journal_id))
+        return rows, seq
     
+    def _settle(self, rows: List[tuple], seq: int):
+        self.buffer.settle(rows)
+        self._journal_seq = max(self._journal_seq, seq)
+    
+    @db_timed("flush")
+    async def flush(self) -> int:
+        async with self._write() as db:
+            rows, seq = await self._write_pending(db)
+        self._settle(rows, seq)
+        
+        if self.journal is not None and self.journal.size > self.journal.compact_size:
+            await self.journal.compact(self._journal_seq)
+        return len(rows)
+    
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+            self._prune_task = None
+        
+        if self.migration_task is not None:
+            # Online jobs keep their cursor in the database and resume on the
+            # next start.
+            self.migration_task.cancel()
+            await asyncio.gather(self.migration_task, return_exceptions=True)
+            self.migration_task = None
+        
+        if self._writer is not None:
+            await self.flush()
+        
+        if self.journal is not None:
+            # After a clean flush nothing in the journal is still needed.
+            await self.journal.sync()
+            await self.journal.compact(self._journal_seq)
+            await self.journal.close()
+        
+        for reader in self._readers:
+            await reader.close()
+        self._readers = []
+        self._idle_readers = None
+        
+        if self._writer is not None:
+            async with self._write_lock:
+                await self._writer.close()
+            self._writer = None
+    
+    def level_for(self, guild_id: int, xp: int) -> int:
+        return self.curve_for(guild_id).level_for(xp)
+    
+    def curve_for(self, guild_id: int) -> XPCurve:
+        config = self._guild_configs.get(guild_id)
+        return config.xp_curve if config is not None else DEFAULT_CURVE
+    
+    async def _load_curves(self, guild_ids: Iterable[int]):
+        # xp_level() runs inside SQLite and can only see cached configs, so
+        # every guild written to must be loaded first.
+        for guild_id in set(guild_ids):
+            if guild_id not in self._guild_configs:
+                await self.get_guild_config(guild_id)
+    
+    @db_timed("get_user_data")
     async def get_user_data(self, user_id: int, guild_id: int) -> dict:
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
+        pending = self.buffer.get(user_id, guild_id)
+        if pending is not None:
+            return pending.as_dict()
+        
+        async with self._read() as db:
+            async with db.execute('''
                 SELECT xp, level, total_messages, last_message_time
                 FROM user_levels
                 WHERE user_id = ? AND guild_id = ?
-            ''', (user_id, guild_id))
+            ''', (user_id, guild_id)) as cursor:
+                row = await cursor.fetchone()
             
-            row = await cursor.fetchone()
             if row:
                 return {
                     'xp': row[0],
@@ -65,100 +412,696 @@ class Database:
                 'last_message_time': 0
             }
     
+    async def _upsert_xp(self, user_id: int, guild_id: int, amount: int, messages: int,
+                         timestamp: float, actor_id: Optional[int] = None) -> Tuple[dict, dict]:
+        await self._load_curves((guild_id,))
+        async with self._write() as db:
+            if actor_id is None:
+                self._journal_append(user_id, guild_id, amount, timestamp)
+            else:
+                seq = self._journal_append(user_id, guild_id, amount, time.time(), SOURCE_ADD, actor_id)
+            rows, journal_seq = await self._write_pending(db)
+            
+            async with db.execute(UPSERT_XP + '''
+                RETURNING xp, level, total_messages, last_message_time
+            ''', (user_id, guild_id, amount, messages, timestamp)) as cursor:
+                row = await cursor.fetchone()
+            
+            if messages:
+                await db.execute(UPSERT_DAILY, (guild_id, day_of(timestamp), user_id, amount, messages))
+            if actor_id is not None:
+                await db.execute(INSERT_AUDIT, (self.journal_id, seq, guild_id, user_id, actor_id, SOURCE_ADD, amount, time.time()))
+        self._settle(rows, journal_seq)
+        
+        new_data = {
+            'xp': row[0],
+            'level': row[1],
+            'total_messages': row[2],
+            'last_message_time': row[3]
+        }
+        old_data = {
+            'xp': row[0] - amount,
+            'level': self.level_for(guild_id, row[0] - amount),
+            'total_messages': row[2] - messages,
+            'last_message_time': row[3]
+        }
+        return old_data, new_data
+    
+    @db_timed("increment_xp")
+    async def increment_xp(self, user_id: int, guild_id: int, amount: int,
+                           messages: int = 0, timestamp: float = 0) -> Tuple[dict, dict]:
+        old_data, new_data = await self._upsert_xp(user_id, guild_id, amount, messages, timestamp)
+        self.ranks.record(guild_id, user_id, old_data['xp'], new_data['xp'])
+        return old_data, new_data
+    
+    @db_timed("queue_xp")
+    async def queue_xp(self, user_id: int, guild_id: int, amount: int, timestamp: float) -> Tuple[dict, dict]:
+        if self.buffer.max_pending <= 0:
+            return await self.increment_xp(user_id, guild_id, amount, 1, timestamp)
+        
+        entry = self.buffer.get(user_id, guild_id)
+        if entry is not None and entry.message_delta and day_of(timestamp) != day_of(entry.last_message_time):
+            # Daily buckets are keyed by the entry's last message, so XP from
+            # before midnight is written out before the new day's XP joins it.
+            await self.flush()
+            entry = self.buffer.get(user_id, guild_id)
+        
+        if entry is None:
+            data = await self.get_user_data(user_id, guild_id)
+            entry = self.buffer.track(user_id, guild_id, data)
+        
+        old_data = entry.as_dict()
+        entry.xp += amount
+        entry.level = self.level_for(guild_id, entry.xp)
+        entry.total_messages += 1
+        entry.last_message_time = timestamp
+        entry.xp_delta += amount
+        entry.message_delta += 1
+        self._journal_append(user_id, guild_id, amount, timestamp)
+        new_data = entry.as_dict()
+        self.ranks.record(guild_id, user_id, old_data['xp'], new_data['xp'])
+        
+        if self.buffer.full:
+            await self.flush()
+        
+        return old_data, new_data
+    
+    @db_timed("award_voice_xp")
+    async def award_voice_xp(self, awards: Mapping[int, Mapping[int, int]],
+                             timestamp: float) -> List[Tuple[int, int, dict, dict]]:
+        # awards maps guild_id -> {user_id: amount}. Every member is written
+        # in one transaction with two executemany calls, and the new totals
+        # are read back a few hundred members per query.
+        await self._load_curves(awards)
+        day = day_of(timestamp)
+        rows = [(user_id, guild_id, amount) for guild_id, members in awards.items() for user_id, amount in members.items()]
+        if not rows:
+            return []
+        
+        stored = []
+        async with self._write() as db:
+            for user_id, guild_id, amount in rows:
+                self._journal_append(user_id, guild_id, amount, timestamp, SOURCE_VOICE)
+            pending_rows, seq = await self._write_pending(db)
+            
+            await db.executemany(UPSERT_XP, [(user_id, guild_id, amount, 0, 0) for user_id, guild_id, amount in rows])
+            await db.executemany(UPSERT_DAILY, [(guild_id, day, user_id, amount, 0) for user_id, guild_id, amount in rows])
+            
+            for guild_id, members in awards.items():
+                user_ids = list(members)
+                for start in range(0, len(user_ids), VOICE_READ_CHUNK):
+                    chunk = user_ids[start:start + VOICE_READ_CHUNK]
+                    async with db.execute(f'''
+                        SELECT user_id, xp, total_messages, last_message_time
+                        FROM user_levels
+                        WHERE guild_id = ? AND user_id IN ({", ".join("?" * len(chunk))})
+                    ''', (guild_id, *chunk)) as cursor:
+                        stored.extend((guild_id, *row) for row in await cursor.fetchall())
+        self._settle(pending_rows, seq)
+        
+        results = []
+        for guild_id, user_id, xp, total_messages, last_message_time in stored:
+            amount = awards[guild_id][user_id]
+            pending = self.buffer.get(user_id, guild_id)
+            if pending is not None:
+                # Message XP buffered since the snapshot is not in the row yet.
+                xp += pending.xp_delta
+                total_messages += pending.message_delta
+                pending.xp = xp
+                pending.level = self.level_for(guild_id, xp)
+                pending.total_messages = total_messages
+                last_message_time = pending.last_message_time
+            self.ranks.record(guild_id, user_id, xp - amount, xp)
+            
+            new_data = {
+                'xp': xp,
+                'level': self.level_for(guild_id, xp),
+                'total_messages': total_messages,
+                'last_message_time': last_message_time
+            }
+            old_data = dict(new_data, xp=xp - amount, level=self.level_for(guild_id, xp - amount))
+            results.append((user_id, guild_id, old_data, new_data))
+        return results
+    
+    @db_timed("update_user_data")
     async def update_user_data(self, user_id: int, guild_id: int, xp: int, level: int, 
                               total_messages: int, last_message_time: float):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT OR REPLACE INTO user_levels 
-                (user_id, guild_id, xp, level, total_messages, last_message_time)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, guild_id, xp, level, total_messages, last_message_time))
-            await db.commit()
-    
-    async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Tuple]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
+        old_xp = (await self.get_user_data(user_id, guild_id))['xp']
+        self.buffer.discard(user_id, guild_id)
+        async with self._write() as db:
+            rows, seq = await self._write_pending(db)
+            await db.execute(UPDATE_USER, (user_id, guild_id, xp, level, total_messages, last_message_time))
+        self._settle(rows, seq)
+        self.ranks.record(guild_id, user_id, old_xp, xp)
+    
+    async def _rank_index(self, guild_id: int) -> Optional[GuildRankIndex]:
+        index = self.ranks.get(guild_id)
+        if index is not None:
+            RANK_INDEX_HITS.inc()
+            return index
+        
+        RANK_INDEX_MISSES.inc()
+        if guild_id in self.ranks.oversized or self.ranks.is_building(guild_id):
+            return None
+        
+        self.ranks.begin_build(guild_id)
+        rows = []
+        try:
+            async with self._read() as db:
+                async with db.execute('''
+                    SELECT user_id, xp
+                    FROM user_levels
+                    WHERE guild_id = ?
+                    ORDER BY xp DESC, user_id
+                ''', (guild_id,)) as cursor:
+                    while True:
+                        chunk = await cursor.fetchmany(10000)
+                        if not chunk:
+                            break
+                        rows.extend(chunk)
+                        if len(rows) > self.ranks.max_guild_members:
+                            self.ranks.abort_build(guild_id, oversized=True)
+                            return None
+        except BaseException:
+            self.ranks.abort_build(guild_id)
+            raise
+        
+        for (user_id, pending_guild_id), entry in self.buffer.pending.items():
+            if pending_guild_id == guild_id:
+                self.ranks.record(guild_id, user_id, entry.xp, entry.xp)
+        return self.ranks.finish_build(guild_id, rows)
+    
+    async def _leaderboard_rows(self, guild_id: int, entries: List[Tuple[int, int]]) -> List[Tuple]:
+        if not entries:
+            return []
+        
+        user_ids = [user_id for user_id, _ in entries]
+        async with self._read() as db:
+            async with db.execute(f'''
+                SELECT user_id, level, total_messages
+                FROM user_levels
+                WHERE guild_id = ? AND user_id IN ({", ".join("?" * len(user_ids))})
+            ''', (guild_id, *user_ids)) as cursor:
+                stored = {row[0]: row[1:] for row in await cursor.fetchall()}
+        
+        rows = []
+        for user_id, xp in entries:
+            pending = self.buffer.get(user_id, guild_id)
+            if pending is not None:
+                level, messages = pending.level, pending.total_messages
+            else:
+                level, messages = stored.get(user_id, (self.level_for(guild_id, xp), 0))
+            rows.append((user_id, xp, level, messages))
+        return rows
+    
+    @db_timed("get_leaderboard")
+    async def get_leaderboard(self, guild_id: int, limit: int = 10, offset: int = 0) -> List[Tuple]:
+        index = await self._rank_index(guild_id)
+        if index is not None:
+            return await self._leaderboard_rows(guild_id, index.slice(offset, limit))
+        
+        async with self._read() as db:
+            async with db.execute('''
                 SELECT user_id, xp, level, total_messages
                 FROM user_levels
                 WHERE guild_id = ?
-                ORDER BY xp DESC
-                LIMIT ?
-            ''', (guild_id, limit))
+                ORDER BY xp DESC, user_id
+                LIMIT ? OFFSET ?
+            ''', (guild_id, limit, offset)) as cursor:
+                return await cursor.fetchall()
+    
+    @db_timed("get_leaderboard_page")
+    async def get_leaderboard_page(self, guild_id: int, limit: int = 10,
+                                   after: Optional[Tuple[int, int]] = None,
+                                   before: Optional[Tuple[int, int]] = None) -> List[Tuple]:
+        # Cursors are the (xp, user_id) of the last/first row already shown,
+        # so each page is a seek on (xp DESC, user_id) instead of an OFFSET.
+        # The plain xp bound is what lets SQLite seek; the OR only breaks ties.
+        index = await self._rank_index(guild_id)
+        if index is not None:
+            if after is not None:
+                entries = index.page_after(after[0], after[1], limit)
+            elif before is not None:
+                entries = index.page_before(before[0], before[1], limit)
+            else:
+                entries = index.slice(0, limit)
+            return await self._leaderboard_rows(guild_id, entries)
+        
+        async with self._read() as db:
+            if after is not None:
+                cursor = await db.execute('''
+                    SELECT user_id, xp, level, total_messages
+                    FROM user_levels
+                    WHERE guild_id = ? AND xp <= ? AND (xp < ? OR user_id > ?)
+                    ORDER BY xp DESC, user_id
+                    LIMIT ?
+                ''', (guild_id, after[0], after[0], after[1], limit))
+            elif before is not None:
+                cursor = await db.execute('''
+                    SELECT user_id, xp, level, total_messages
+                    FROM user_levels
+                    WHERE guild_id = ? AND xp >= ? AND (xp > ? OR user_id < ?)
+                    ORDER BY xp ASC, user_id DESC
+                    LIMIT ?
+                ''', (guild_id, before[0], before[0], before[1], limit))
+            else:
+                cursor = await db.execute('''
+                    SELECT user_id, xp, level, total_messages
+                    FROM user_levels
+                    WHERE guild_id = ?
+                    ORDER BY xp DESC, user_id
+                    LIMIT ?
+                ''', (guild_id, limit))
             
-            return await cursor.fetchall()
+            async with cursor:
+                rows = await cursor.fetchall()
+        
+        if before is not None:
+            rows.reverse()
+        return rows
     
+    @db_timed("count_ranked_users")
+    async def count_ranked_users(self, guild_id: int) -> int:
+        index = await self._rank_index(guild_id)
+        if index is not None:
+            return len(index)
+        
+        async with self._read() as db:
+            async with db.execute('''
+                SELECT COUNT(*) FROM user_levels WHERE guild_id = ?
+            ''', (guild_id,)) as cursor:
+                return (await cursor.fetchone())[0]
+    
+    async def _period_rows(self, guild_id: int, rows: List[Tuple]) -> List[Tuple]:
+        if not rows:
+            return []
+        
+        user_ids = [row[0] for row in rows]
+        async with self._read() as db:
+            async with db.execute(f'''
+                SELECT user_id, level
+                FROM user_levels
+                WHERE guild_id = ? AND user_id IN ({", ".join("?" * len(user_ids))})
+            ''', (guild_id, *user_ids)) as cursor:
+                levels = dict(await cursor.fetchall())
+        
+        result = []
+        for user_id, xp, messages in rows:
+            pending = self.buffer.get(user_id, guild_id)
+            level = pending.level if pending is not None else levels.get(user_id, 0)
+            result.append((user_id, xp, level, messages))
+        return result
+    
+    async def _period_window(self, guild_id: int, days: int) -> Tuple[GuildRankIndex, Dict[int, int]]:
+        # Sums at most `days` pre-aggregated buckets per active member, once
+        # per period_ttl: paging and /serverstats are then served from the
+        # ranked window in memory. The first day is part of the key, so a
+        # new day starts a new window.
+        since = day_of(time.time()) - days + 1
+        key = (guild_id, days, since)
+        cached = self._period_windows.get(key)
+        if cached is not None and cached[2] > time.monotonic():
+            self._period_windows.move_to_end(key)
+            PERIOD_WINDOW_HITS.inc()
+            return cached[0], cached[1]
+        
+        PERIOD_WINDOW_MISSES.inc()
+        async with self._read() as db:
+            async with db.execute('''
+                SELECT user_id, SUM(xp) AS period_xp, SUM(messages)
+                FROM xp_daily
+                WHERE guild_id = ? AND day >= ?
+                GROUP BY user_id
+                ORDER BY period_xp DESC, user_id
+            ''', (guild_id, since)) as cursor:
+                rows = await cursor.fetchall()
+        
+        index = GuildRankIndex((user_id, xp) for user_id, xp, _ in rows)
+        messages = {user_id: count for user_id, _, count in rows}
+        self._period_windows[key] = (index, messages, time.monotonic() + self.period_ttl)
+        self._period_windows.move_to_end(key)
+        while len(self._period_windows) > self.max_period_windows:
+            self._period_windows.popitem(last=False)
+        return index, messages
+    
+    @db_timed("get_period_leaderboard")
+    async def get_period_leaderboard(self, guild_id: int, days: int, limit: int = 10, offset: int = 0) -> List[Tuple]:
+        # Rows are (user_id, period_xp, current_level, period_messages).
+        index, messages = await self._period_window(guild_id, days)
+        rows = [(user_id, xp, messages[user_id]) for user_id, xp in index.slice(offset, limit)]
+        return await self._period_rows(guild_id, rows)
+    
+    @db_timed("get_period_leaderboard_page")
+    async def get_period_leaderboard_page(self, guild_id: int, days: int, limit: int = 10,
+                                          after: Optional[Tuple[int, int]] = None,
+                                          before: Optional[Tuple[int, int]] = None) -> List[Tuple]:
+        index, messages = await self._period_window(guild_id, days)
+        if after is not None:
+            page = index.page_after(after[0], after[1], limit)
+        elif before is not None:
+            page = index.page_before(before[0], before[1], limit)
+        else:
+            page = index.slice(0, limit)
+        rows = [(user_id, xp, messages[user_id]) for user_id, xp in page]
+        return await self._period_rows(guild_id, rows)
+    
+    @db_timed("count_period_users")
+    async def count_period_users(self, guild_id: int, days: int) -> int:
+        index, _ = await self._period_window(guild_id, days)
+        return len(index)
+    
+    @db_timed("get_guild_stats")
+    async def get_guild_stats(self, guild_id: int) -> dict:
+        # guild_stats and level_histogram are kept current by triggers on
+        # user_levels, so this reads a handful of rows however large the
+        # guild is. Buffered XP is added on top in memory rather than
+        # flushed; a buffered member with nothing stored before the buffer
+        # counts as new.
+        async with self._read() as db:
+            async with db.execute('''
+                SELECT total_xp, members, total_messages FROM guild_stats WHERE guild_id = ?
+            ''', (guild_id,)) as cursor:
+                row = await cursor.fetchone()
+            
+            async with db.execute('''
+                SELECT level, members FROM level_histogram
+                WHERE guild_id = ? AND members > 0
+                ORDER BY level
+            ''', (guild_id,)) as cursor:
+                histogram = dict(await cursor.fetchall())
+        
+        total_xp, members, total_messages = row if row else (0, 0, 0)
+        for (user_id, pending_guild_id), entry in self.buffer.pending.items():
+            if pending_guild_id != guild_id or not (entry.xp_delta or entry.message_delta):
+                continue
+            total_xp += entry.xp_delta
+            total_messages += entry.message_delta
+            stored_xp = entry.xp - entry.xp_delta
+            if stored_xp == 0 and entry.total_messages == entry.message_delta:
+                members += 1
+            else:
+                stored_level = self.level_for(guild_id, stored_xp)
+                histogram[stored_level] = histogram.get(stored_level, 0) - 1
+            histogram[entry.level] = histogram.get(entry.level, 0) + 1
+        
+        return {
+            'total_xp': total_xp,
+            'members': members,
+            'total_messages': total_messages,
+            'levels': sorted((level, count) for level, count in histogram.items() if count > 0)
+        }
+    
+    @db_timed("get_user_rank")
     async def get_user_rank(self, user_id: int, guild_id: int) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
+        index = await self._rank_index(guild_id)
+        if index is not None:
+            xp = (await self.get_user_data(user_id, guild_id))['xp']
+            return index.rank(xp)
+        
+        async with self._read() as db:
+            async with db.execute('''
                 SELECT COUNT(*) + 1
                 FROM user_levels
                 WHERE guild_id = ? AND xp > (
                     SELECT xp FROM user_levels
                     WHERE user_id = ? AND guild_id = ?
                 )
-            ''', (guild_id, user_id, guild_id))
+            ''', (guild_id, user_id, guild_id)) as cursor:
+                result = await cursor.fetchone()
             
-            result = await cursor.fetchone()
             return result[0] if result else 0
     
-    async def get_guild_config(self, guild_id: int) -> dict:
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
-                SELECT xp_per_message, xp_cooldown, level_up_channel, 
-                       level_roles, announcement_enabled
+    @db_timed("get_users_around")
+    async def get_users_around(self, user_id: int, guild_id: int, radius: int = 2) -> Tuple[int, List[Tuple]]:
+        xp = (await self.get_user_data(user_id, guild_id))['xp']
+        index = await self._rank_index(guild_id)
+        if index is not None:
+            first_rank, entries = index.around(user_id, xp, radius)
+            return first_rank, await self._leaderboard_rows(guild_id, entries)
+        
+        rank = await self.get_user_rank(user_id, guild_id)
+        offset = max(0, rank - 1 - radius)
+        return offset + 1, await self.get_leaderboard(guild_id, 2 * radius + 1, offset)
+    
+    @db_timed("get_guild_config")
+    async def get_guild_config(self, guild_id: int) -> GuildConfig:
+        config = self._guild_configs.get(guild_id)
+        if config is not None:
+            CONFIG_CACHE_HITS.inc()
+            return config
+        
+        CONFIG_CACHE_MISSES.inc()
+        async with self._read() as db:
+            async with db.execute('''
+                SELECT xp_per_message, xp_cooldown, level_up_channel, announcement_enabled, xp_curve, voice_xp
                 FROM guild_config
                 WHERE guild_id = ?
-            ''', (guild_id,))
+            ''', (guild_id,)) as cursor:
+                row = await cursor.fetchone()
             
-            row = await cursor.fetchone()
-            if row:
-                return {
-                    'xp_per_message': row[0],
-                    'xp_cooldown': row[1],
-                    'level_up_channel': row[2],
-                    'level_roles': row[3],
-                    'announcement_enabled': row[4]
-                }
-            
-            return {
-                'xp_per_message': 15,
-                'xp_cooldown': 60,
-                'level_up_channel': None,
-                'level_roles': '{}',
-                'announcement_enabled': 1
-            }
+            async with db.execute('''
+                SELECT level, role_id FROM level_roles WHERE guild_id = ?
+            ''', (guild_id,)) as cursor:
+                level_roles = LevelRoles(dict(await cursor.fetchall()))
+        
+        if row:
+            config = GuildConfig(
+                xp_per_message=row[0],
+                xp_cooldown=row[1],
+                level_up_channel=row[2],
+                level_roles=level_roles,
+                announcement_enabled=row[3],
+                xp_curve=parse_curve(row[4]),
+                voice_xp=row[5]
+            )
+        else:
+            config = GuildConfig(level_roles=level_roles)
+        
+        # An update may have landed while this load was awaiting the reader;
+        # keep the newer cached value in that case.
+        return self._guild_configs.setdefault(guild_id, config)
+    
+    def cached_guild_config(self, guild_id: int) -> Optional[GuildConfig]:
+        config = self._guild_configs.get(guild_id)
+        if config is not None:
+            CONFIG_CACHE_HITS.inc()
+        return config
     
-    async def update_guild_config(self, guild_id: int, **kwargs):
-        async with aiosqlite.connect(self.db_path) as db:
+    @db_timed("update_guild_config")
+    async def update_guild_config(self, guild_id: int, **kwargs) -> GuildConfig:
+        if 'level_roles' in kwargs:
+            kwargs['level_roles'] = parse_level_roles(kwargs['level_roles'])
+        if 'xp_curve' in kwargs and not isinstance(kwargs['xp_curve'], XPCurve):
+            kwargs['xp_curve'] = compile_curve(kwargs['xp_curve'])
+        
+        async with self._write() as db:
+            config = (await self.get_guild_config(guild_id))._replace(**kwargs)
             await db.execute('''
                 INSERT OR REPLACE INTO guild_config 
                 (guild_id, xp_per_message, xp_cooldown, level_up_channel, 
-                 level_roles, announcement_enabled)
-                VALUES (?, ?, ?, ?, ?, ?)
+                 announcement_enabled, xp_curve, voice_xp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (
                 guild_id,
-                kwargs.get('xp_per_message', 15),
-                kwargs.get('xp_cooldown', 60),
-                kwargs.get('level_up_channel'),
-                kwargs.get('level_roles', '{}'),
-                kwargs.get('announcement_enabled', 1)
+                config.xp_per_message,
+                config.xp_cooldown,
+                config.level_up_channel,
+                config.announcement_enabled,
+                config.xp_curve.to_json(),
+                config.voice_xp
             ))
-            await db.commit()
+            
+            if 'level_roles' in kwargs:
+                await db.execute('DELETE FROM level_roles WHERE guild_id = ?', (guild_id,))
+                await db.executemany('''
+                    INSERT INTO level_roles (guild_id, level, role_id) VALUES (?, ?, ?)
+                ''', [(guild_id, level, role_id) for level, role_id in config.level_roles.items()])
+        
+        self._guild_configs[guild_id] = config
+        if 'xp_curve' in kwargs:
+            for (user_id, pending_guild_id), entry in self.buffer.pending.items():
+                if pending_guild_id == guild_id:
+                    entry.level = config.xp_curve.level_for(entry.xp)
+        return config
     
-    async def add_xp(self, user_id: int, guild_id: int, amount: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                UPDATE user_levels
-                SET xp = xp + ?
-                WHERE user_id = ? AND guild_id = ?
-            ''', (amount, user_id, guild_id))
-            await db.commit()
+    def invalidate_guild_config(self, guild_id: int):
+        self._guild_configs.pop(guild_id, None)
+    
+    @db_timed("get_level_chunk")
+    async def get_level_chunk(self, guild_id: int, after_user_id: int = 0, limit: int = 500) -> List[Tuple[int, int]]:
+        async with self._read() as db:
+            async with db.execute('''
+                SELECT user_id, xp
+                FROM user_levels
+                WHERE guild_id = ? AND user_id > ?
+                ORDER BY user_id
+                LIMIT ?
+            ''', (guild_id, after_user_id, limit)) as cursor:
+                rows = await cursor.fetchall()
+        
+        chunk = []
+        for user_id, xp in rows:
+            pending = self.buffer.get(user_id, guild_id)
+            if pending is not None:
+                xp = pending.xp
+            chunk.append((user_id, self.level_for(guild_id, xp)))
+        return chunk
+    
+    @db_timed("recalculate_levels")
+    async def recalculate_levels(self, guild_id: Optional[int] = None, chunk_size: int = 5000,
+                                 pause: float = 0.01) -> Tuple[int, int]:
+        scanned = changed = 0
+        after = None
+        while True:
+            # Each chunk is read and rewritten under the write lock, so no
+            # flush can change a row between computing its level and saving it.
+            async with self._write() as db:
+                async with db.execute(*scan_statement(guild_id, after, chunk_size)) as cursor:
+                    rows = await cursor.fetchall()
+                
+                await self._load_curves(row[1] for row in rows)
+                changes = level_changes(rows, self.curve_for)
+                if changes:
+                    await db.executemany(UPDATE_LEVEL, changes)
+            
+            scanned += len(rows)
+            changed += len(changes)
+            if len(rows) < chunk_size:
+                return scanned, changed
+            
+            after = scan_cursor(guild_id, rows)
+            await asyncio.sleep(pause)
+    
+    @db_timed("get_display_names")
+    async def get_display_names(self, guild_id: int, user_ids: List[int]) -> Dict[int, str]:
+        if not user_ids:
+            return {}
+        
+        async with self._read() as db:
+            async with db.execute(f'''
+                SELECT user_id, display_name
+                FROM user_names
+                WHERE guild_id = ? AND user_id IN ({", ".join("?" * len(user_ids))})
+            ''', (guild_id, *user_ids)) as cursor:
+                return {row[0]: row[1] for row in await cursor.fetchall()}
     
-    async def set_xp(self, user_id: int, guild_id: int, amount: int):
-        async with aiosqlite.connect(self.db_path) as db:
+    @db_timed("save_display_names")
+    async def save_display_names(self, guild_id: int, names: Mapping[int, str]):
+        now = time.time()
+        async with self._write() as db:
+            await db.executemany('''
+                INSERT INTO user_names (guild_id, user_id, display_name, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                    display_name = excluded.display_name,
+                    updated_at = excluded.updated_at
+                WHERE display_name != excluded.display_name
+            ''', [(guild_id, user_id, name, now) for user_id, name in names.items()])
+    
+    async def get_backfill_jobs(self) -> List[dict]:
+        async with self._read() as db:
+            async with db.execute('''
+                SELECT guild_id, last_user_id, processed, updated, channel_id, message_id, started_at
+                FROM role_backfill_jobs
+            ''') as cursor:
+                rows = await cursor.fetchall()
+        
+        return [
+            {
+                'guild_id': row[0],
+                'last_user_id': row[1],
+                'processed': row[2],
+                'updated': row[3],
+                'channel_id': row[4],
+                'message_id': row[5],
+                'started_at': row[6]
+            }
+            for row in rows
+        ]
+    
+    async def save_backfill_job(self, guild_id: int, last_user_id: int, processed: int, updated: int,
+                                channel_id: Optional[int], message_id: Optional[int], started_at: float):
+        async with self._write() as db:
             await db.execute('''
-                INSERT OR REPLACE INTO user_levels 
-                (user_id, guild_id, xp, level, total_messages, last_message_time)
-                VALUES (?, ?, ?, 0, 0, 0)
-            ''', (user_id, guild_id, amount))
-            await db.commit()
+                INSERT OR REPLACE INTO role_backfill_jobs
+                (guild_id, last_user_id, processed, updated, channel_id, message_id, started_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (guild_id, last_user_id, processed, updated, channel_id, message_id, started_at))
+    
+    async def delete_backfill_job(self, guild_id: int):
+        async with self._write() as db:
+            await db.execute('DELETE FROM role_backfill_jobs WHERE guild_id = ?', (guild_id,))
+    
+    @db_timed("get_xp_audit")
+    async def get_xp_audit(self, guild_id: int, user_id: Optional[int] = None, limit: int = 10) -> List[Tuple]:
+        # Rows are (seq, user_id, actor_id, source, amount, timestamp), newest first.
+        async with self._read() as db:
+            if user_id is None:
+                cursor = await db.execute('''
+                    SELECT seq, user_id, actor_id, source, amount, timestamp
+                    FROM xp_audit
+                    WHERE guild_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                ''', (guild_id, limit))
+            else:
+                cursor = await db.execute('''
+                    SELECT seq, user_id, actor_id, source, amount, timestamp
+                    FROM xp_audit
+                    WHERE guild_id = ? AND user_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                ''', (guild_id, user_id, limit))
+            
+            async with cursor:
+                return await cursor.fetchall()
+    
+    @db_timed("add_xp")
+    async def add_xp(self, user_id: int, guild_id: int, amount: int, actor_id: int = 0) -> Tuple[dict, dict]:
+        old_data, new_data = await self._upsert_xp(user_id, guild_id, amount, 0, 0, actor_id)
+        
+        # Buffered deltas are flushed on top of the row later, so the pending
+        # totals just move by the same amount.
+        pending = self.buffer.get(user_id, guild_id)
+        if pending is not None:
+            old_data = pending.as_dict()
+            pending.xp += amount
+            pending.level = self.level_for(guild_id, pending.xp)
+            new_data = pending.as_dict()
+        
+        self.ranks.record(guild_id, user_id, old_data['xp'], new_data['xp'])
+        return old_data, new_data
+    
+    @db_timed("set_xp")
+    async def set_xp(self, user_id: int, guild_id: int, amount: int, actor_id: int = 0) -> Tuple[dict, dict]:
+        old_data = await self.get_user_data(user_id, guild_id)
+        await self._load_curves((guild_id,))
+        async with self._write() as db:
+            now = time.time()
+            seq = self._journal_append(user_id, guild_id, amount, now, SOURCE_SET, actor_id)
+            rows, journal_seq = await self._write_pending(db)
+            
+            async with db.execute(SET_XP + '''
+                RETURNING xp, level, total_messages, last_message_time
+            ''', (user_id, guild_id, amount)) as cursor:
+                row = await cursor.fetchone()
+            await db.execute(INSERT_AUDIT, (self.journal_id, seq, guild_id, user_id, actor_id, SOURCE_SET, amount, now))
+        self._settle(rows, journal_seq)
+        
+        new_data = {
+            'xp': row[0],
+            'level': row[1],
+            'total_messages': row[2],
+            'last_message_time': row[3]
+        }
+        
+        # Whatever is still buffered was queued after the set in journal
+        # order, so it stays on top of the new total.
+        pending = self.buffer.get(user_id, guild_id)
+        if pending is not None:
+            pending.xp = amount + pending.xp_delta
+            pending.level = self.level_for(guild_id, pending.xp)
+            new_data = pending.as_dict()
+        
+        self.ranks.record(guild_id, user_id, old_data['xp'], new_data['xp'])
+        return old_data, new_data
@@ -1,10 +1,26 @@
-import discord
 from discord.ext import commands
 import json
+from .roles import reconcile_member_roles
+from .metrics import MESSAGES_COOLDOWN, MESSAGES_SEEN, count_error
+from .ingest import MessageQueue
+from .announcements import AnnouncementDispatcher
+from .voice import VoiceTracker
 
 class Events(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, workers: int = 4, queue_size: int = 10_000, shed_policy: str = "drop_oldest"):
         self.bot = bot
+        self.queue = MessageQueue(self.process_message, workers=workers, max_size=queue_size, policy=shed_policy)
+        self.announcements = AnnouncementDispatcher()
+        self.voice = VoiceTracker(bot.leveling, self.handle_level_up)
+    
+    async def cog_load(self):
+        self.queue.start()
+        self.voice.start()
+    
+    async def cog_unload(self):
+        await self.voice.stop()
+        await self.queue.stop()
+        await self.announcements.stop()
     
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -14,86 +30,94 @@ class Events(commands.Cog):
         if not message.guild:
             return
         
+        MESSAGES_SEEN.inc()
+        
         if len(message.content) < 3:
             return
         
+        if self.bot.leveling.on_cooldown(message.author.id, message.guild.id):
+            MESSAGES_COOLDOWN.inc()
+            return
+        
+        # Coalescing is only safe when the guild is known to have a cooldown.
+        config = self.bot.db.cached_guild_config(message.guild.id)
+        coalesce = config is not None and config.xp_cooldown > 0
+        self.queue.submit(message.author.id, message.guild.id, message, coalesce)
+    
+    async def process_message(self, message):
         try:
             result = await self.bot.leveling.process_message(
                 message.author.id,
                 message.guild.id,
-                len(message.content)
+                len(message.content),
+                message.content
             )
             
             if result and result['level_up']:
-                await self.handle_level_up(message, result)
+                if self.queue.overloaded:
+                    self.queue.defer(lambda: self.handle_level_up(message.author, message.channel, result))
+                else:
+                    await self.handle_level_up(message.author, message.channel, result)
                 
         except Exception as e:
+            count_error("message")
             print(f"Error processing message XP: {e}")
     
-    async def handle_level_up(self, message, result):
+    async def handle_level_up(self, user, source_channel, result):
         try:
-            config = await self.bot.db.get_guild_config(message.guild.id)
-            
-            if not config['announcement_enabled']:
-                return
+            config = await self.bot.db.get_guild_config(user.guild.id)
             
             new_level = result['new_level']
-            user = message.author
-            
-            embed = discord.Embed(
-                title="🎉 Level Up!",
-                description=f"{user.mention} has reached **Level {new_level}**!",
-                color=0x00ff00
-            )
             
-            embed.add_field(
-                name="Total XP",
-                value=f"{result['total_xp']:,}",
-                inline=True
-            )
+            await self.assign_level_roles(user, user.guild, new_level, config.level_roles)
             
-            embed.add_field(
-                name="Messages Sent",
-                value=f"{result['total_messages']:,}",
-                inline=True
-            )
-            
-            embed.set_thumbnail(url=user.display_avatar.url)
+            if not config.announcement_enabled:
+                return
             
-            channel = message.channel
-            if config['level_up_channel']:
-                channel = self.bot.get_channel(config['level_up_channel'])
+            channel = source_channel
+            if config.level_up_channel:
+                channel = self.bot.get_channel(config.level_up_channel)
                 if not channel:
-                    channel = message.channel
+                    channel = source_channel
             
-            await channel.send(embed=embed)
-            
-            await self.assign_level_roles(user, message.guild, new_level)
+            self.announcements.announce(channel, user, result)
             
         except Exception as e:
+            count_error("level_up")
             print(f"Error handling level up: {e}")
     
-    async def assign_level_roles(self, user, guild, new_level):
+    async def assign_level_roles(self, user, guild, new_level, level_roles=None):
         try:
-            level_roles = await self.bot.leveling.get_level_roles(guild.id)
+            if level_roles is None:
+                level_roles = await self.bot.leveling.get_level_roles(guild.id)
             
-            for level_str, role_id in level_roles.items():
-                level = int(level_str)
-                role = guild.get_role(role_id)
-                
-                if not role:
-                    continue
-                
-                if level <= new_level:
-                    if role not in user.roles:
-                        await user.add_roles(role, reason=f"Reached level {level}")
-                else:
-                    if role in user.roles:
-                        await user.remove_roles(role, reason=f"Below level {level}")
-                        
+            if not level_roles:
+                return
+            
+            roles = reconcile_member_roles(user, level_roles, new_level)
+            if roles is None:
+                return
+            
+            await user.edit(roles=roles, reason=f"Reached level {new_level}")
+        
         except Exception as e:
+            count_error("level_roles")
             print(f"Error assigning level roles: {e}")
     
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        if member.guild is not None:
+            self.voice.update(member, before, after)
+    
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.voice.rebuild(self.bot.guilds)
+    
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.display_name != after.display_name:
+            self.bot.names.remember(after)
+    
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
         try:
@@ -102,4 +126,5 @@ class Events(commands.Cog):
                 await self.bot.db.update_guild_config(guild.id)
                 
         except Exception as e:
+            count_error("guild_join")
             print(f"Error setting up new guild: {e}")
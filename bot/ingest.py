@@ -0,0 +1,109 @@
+import asyncio
+import itertools
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, List
+from .metrics import count_error, metrics
+
+SHED_POLICIES = ("drop_newest", "drop_oldest")
+
+class MessageQueue:
+    def __init__(self, handler: Callable[[object], Awaitable[None]], workers: int = 4,
+                 max_size: int = 10_000, policy: str = "drop_oldest", high_water: float = 0.75):
+        if policy not in SHED_POLICIES:
+            raise ValueError(f"Unknown load-shedding policy: {policy}")
+        
+        self.handler = handler
+        self.worker_count = max(1, workers)
+        self.max_size = max_size
+        self.policy = policy
+        self.high_water = int(max_size * high_water)
+        self._pending: 'OrderedDict[tuple, object]' = OrderedDict()
+        self._sequence = itertools.count()
+        self._deferred: Deque[Callable[[], Awaitable[None]]] = deque()
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._closing = False
+        
+        self.coalesced = metrics.counter("levelbot_ingest_coalesced_total", "Messages merged into queued work for the same member")
+        self.shed_newest = metrics.counter("levelbot_ingest_shed_total", "Messages dropped under overload", policy="drop_newest")
+        self.shed_oldest = metrics.counter("levelbot_ingest_shed_total", "Messages dropped under overload", policy="drop_oldest")
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+    
+    @property
+    def deferred(self) -> int:
+        return len(self._deferred)
+    
+    @property
+    def overloaded(self) -> bool:
+        return len(self._pending) >= self.high_water
+    
+    def start(self):
+        self._closing = False
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.create_task(self._run()))
+    
+    async def stop(self, timeout: float = 10.0):
+        self._closing = True
+        self._wakeup.set()
+        if self._workers:
+            _, running = await asyncio.wait(self._workers, timeout=timeout)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        self._workers = []
+    
+    def submit(self, user_id: int, guild_id: int, item, coalesce: bool = True) -> bool:
+        # Only the first message of a burst can earn XP before the cooldown
+        # kicks in, so the queued one is kept and later ones add no work.
+        # Without a cooldown every message earns XP and gets its own slot.
+        if coalesce:
+            key = (user_id, guild_id)
+            if key in self._pending:
+                self.coalesced.inc()
+                return False
+        else:
+            key = (user_id, guild_id, next(self._sequence))
+        
+        if len(self._pending) >= self.max_size:
+            if self.policy == "drop_newest":
+                self.shed_newest.inc()
+                return False
+            self._pending.popitem(last=False)
+            self.shed_oldest.inc()
+        
+        self._pending[key] = item
+        self._wakeup.set()
+        return True
+    
+    def defer(self, job: Callable[[], Awaitable[None]]):
+        self._deferred.append(job)
+        self._wakeup.set()
+    
+    async def _run(self):
+        handled = 0
+        while True:
+            handled += 1
+            if handled % 100 == 0:
+                # Cooldown-rejected items finish without awaiting anything;
+                # yield now and then so a deep queue cannot hog the loop.
+                await asyncio.sleep(0)
+            
+            if self._pending:
+                _, item = self._pending.popitem(last=False)
+                await self._call(self.handler(item))
+            elif self._deferred:
+                await self._call(self._deferred.popleft()())
+            elif self._closing:
+                return
+            else:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+    
+    async def _call(self, awaitable: Awaitable[None]):
+        try:
+            await awaitable
+        except Exception as e:
+            count_error("message_worker")
+            print(f"Error in message worker: {e}")
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import struct
+import zlib
+from typing import List, NamedTuple, Optional
+
+# seq, guild_id, user_id, actor_id, amount, timestamp, source + CRC32
+RECORD = struct.Struct('<QQQQqdB')
+CHECKSUM = struct.Struct('<I')
+RECORD_SIZE = RECORD.size + CHECKSUM.size
+
+SOURCE_MESSAGE = 0
+SOURCE_ADD = 1
+SOURCE_SET = 2
+SOURCE_VOICE = 3
+
+SOURCE_NAMES = {
+    SOURCE_MESSAGE: "message",
+    SOURCE_ADD: "addxp",
+    SOURCE_SET: "setxp",
+    SOURCE_VOICE: "voice"
+}
+
+class JournalEvent(NamedTuple):
+    seq: int
+    guild_id: int
+    user_id: int
+    actor_id: int
+    amount: int
+    timestamp: float
+    source: int
+
+class XPJournal:
+    def __init__(self, path: str, sync_interval: float = 0.1, max_unsynced: int = 64 * 1024,
+                 compact_size: int = 16 * 1024 * 1024):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.max_unsynced = max_unsynced
+        self.compact_size = compact_size
+        self.seq = 0
+        self._first_seq = 1
+        self._written = 0
+        self._unsynced = bytearray()
+        self._fd: Optional[int] = None
+        self._io_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._sync_task: Optional[asyncio.Task] = None
+    
+    @property
+    def size(self) -> int:
+        return self._written + len(self._unsynced)
+    
+    def open(self, last_seq: int) -> List[JournalEvent]:
+        events = []
+        valid = 0
+        first_seq = None
+        data = b""
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        
+        # A crash can leave a torn record at the end; everything from the
+        # first record that fails its checksum onwards is discarded.
+        for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+            body = data[offset:offset + RECORD.size]
+            (checksum,) = CHECKSUM.unpack_from(data, offset + RECORD.size)
+            if zlib.crc32(body) != checksum:
+                break
+            event = JournalEvent(*RECORD.unpack(body))
+            if first_seq is None:
+                first_seq = event.seq
+            elif event.seq != first_seq + offset // RECORD_SIZE:
+                break
+            valid = offset + RECORD_SIZE
+            if event.seq > last_seq:
+                events.append(event)
+        
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        os.ftruncate(self._fd, valid)
+        os.lseek(self._fd, valid, os.SEEK_SET)
+        self._written = valid
+        
+        last_in_file = first_seq + valid // RECORD_SIZE - 1 if first_seq is not None else 0
+        self.seq = max(last_seq, last_in_file)
+        self._first_seq = first_seq if first_seq is not None else self.seq + 1
+        return events
+    
+    def start(self):
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+    
+    def append(self, guild_id: int, user_id: int, amount: int, timestamp: float,
+               source: int = SOURCE_MESSAGE, actor_id: int = 0) -> int:
+        # Only an in-memory append; the sync task writes and fsyncs batches,
+        # so a message costs far less than a SQLite transaction.
+        self.seq += 1
+        body = RECORD.pack(self.seq, guild_id, user_id, actor_id, amount, timestamp, source)
+        self._unsynced += body
+        self._unsynced += CHECKSUM.pack(zlib.crc32(body))
+        if len(self._unsynced) >= self.max_unsynced:
+            self._wakeup.set()
+        return self.seq
+    
+    async def _sync_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Error syncing XP journal: {e}")
+    
+    async def sync(self):
+        async with self._io_lock:
+            if not self._unsynced or self._fd is None:
+                return
+            data = bytes(self._unsynced)
+            self._unsynced.clear()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+            except BaseException:
+                self._unsynced[:0] = data
+                raise
+            self._written += len(data)
+    
+    def _write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+        os.fsync(self._fd)
+    
+    async def compact(self, last_seq: int):
+        # Records up to last_seq are already committed to user_levels; keep
+        # only the tail that is not.
+        async with self._io_lock:
+            if self._fd is None:
+                return
+            drop = max(0, min(last_seq - self._first_seq + 1, self._written // RECORD_SIZE))
+            if not drop:
+                return
+            await asyncio.get_running_loop().run_in_executor(None, self._rewrite, drop * RECORD_SIZE)
+            self._first_seq += drop
+            self._written -= drop * RECORD_SIZE
+    
+    def _rewrite(self, start: int):
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            tail = f.read(self._written - start)
+        
+        temp_path = self.path + ".tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(tail)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        except BaseException:
+            os.close(fd)
+            raise
+        os.replace(temp_path, self.path)
+        os.close(self._fd)
+        self._fd = fd
+        os.lseek(self._fd, len(tail), os.SEEK_SET)
+    
+    async def close(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        await self.sync()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -1,66 +1,73 @@
+import asyncio
 import time
 import random
-import json
-import math
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
 from .database import Database
+from .cooldowns import CooldownWheel, cooldown_key
+from .curves import DEFAULT_CURVE, XPCurve
+from .repeats import RepeatFilter
+from .roles import LevelRoles
+from .metrics import LEVEL_UPS, MESSAGES_COOLDOWN, MESSAGES_REPEATED, MESSAGES_REWARDED, VOICE_AWARDS, count_error
 
 class LevelingSystem:
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, max_cooldowns: int = 500_000, repeat_window: float = 600.0):
         self.db = database
-        self.cooldowns: Dict[str, float] = {}
+        # Cooldown entries linger for repeat_window after they end so the
+        # repeat filter's recent messages are forgotten along with them.
+        self.cooldowns = CooldownWheel(max_entries=max_cooldowns, linger=repeat_window)
+        self.repeats = RepeatFilter(self.cooldowns)
+        self.recalculations: Dict[int, asyncio.Task] = {}
     
-    def calculate_level_from_xp(self, xp: int) -> int:
-        if xp < 0:
-            return 0
-        return int(math.floor(0.1 * math.sqrt(xp)))
+    def calculate_level_from_xp(self, xp: int, curve: XPCurve = DEFAULT_CURVE) -> int:
+        return curve.level_for(xp)
     
-    def calculate_xp_for_level(self, level: int) -> int:
-        return int((level / 0.1) ** 2)
+    def calculate_xp_for_level(self, level: int, curve: XPCurve = DEFAULT_CURVE) -> int:
+        return curve.xp_for_level(level)
     
-    def get_xp_for_next_level(self, current_xp: int) -> int:
-        current_level = self.calculate_level_from_xp(current_xp)
-        next_level_xp = self.calculate_xp_for_level(current_level + 1)
-        return next_level_xp - current_xp
+    def get_xp_for_next_level(self, current_xp: int, curve: XPCurve = DEFAULT_CURVE) -> int:
+        current_level = curve.level_for(current_xp)
+        return curve.xp_for_level(current_level + 1) - current_xp
     
-    async def should_award_xp(self, user_id: int, guild_id: int) -> bool:
-        cooldown_key = f"{user_id}:{guild_id}"
-        current_time = time.time()
-        
-        config = await self.db.get_guild_config(guild_id)
-        cooldown_period = config['xp_cooldown']
-        
-        if cooldown_key in self.cooldowns:
-            if current_time - self.cooldowns[cooldown_key] < cooldown_period:
-                return False
-        
-        self.cooldowns[cooldown_key] = current_time
-        return True
+    def on_cooldown(self, user_id: int, guild_id: int) -> bool:
+        return self.cooldowns.is_cooling(cooldown_key(user_id, guild_id), time.monotonic())
+    
+    def should_award_xp(self, user_id: int, guild_id: int, cooldown_period: int) -> bool:
+        return self.cooldowns.try_acquire(cooldown_key(user_id, guild_id), time.monotonic(), cooldown_period)
     
-    async def process_message(self, user_id: int, guild_id: int, message_length: int) -> Optional[dict]:
-        if not await self.should_award_xp(user_id, guild_id):
+    async def process_message(self, user_id: int, guild_id: int, message_length: int,
+                              content: Optional[str] = None) -> Optional[dict]:
+        if self.on_cooldown(user_id, guild_id):
+            MESSAGES_COOLDOWN.inc()
             return None
         
-        config = await self.db.get_guild_config(guild_id)
-        user_data = await self.db.get_user_data(user_id, guild_id)
+        config = self.db.cached_guild_config(guild_id) or await self.db.get_guild_config(guild_id)
+        if not self.should_award_xp(user_id, guild_id, config.xp_cooldown):
+            MESSAGES_COOLDOWN.inc()
+            return None
+        
+        scale = self.repeats.check(cooldown_key(user_id, guild_id), content) if content is not None else 1.0
         
-        base_xp = config['xp_per_message']
+        base_xp = config.xp_per_message
         length_bonus = min(message_length // 10, 5)
         random_bonus = random.randint(0, 5)
-        total_xp = base_xp + length_bonus + random_bonus
+        total_xp = int((base_xp + length_bonus + random_bonus) * scale)
+        if total_xp <= 0:
+            MESSAGES_REPEATED.inc()
+            return None
         
-        old_level = user_data['level']
-        new_xp = user_data['xp'] + total_xp
-        new_level = self.calculate_level_from_xp(new_xp)
-        new_messages = user_data['total_messages'] + 1
+        old_data, new_data = await self.db.queue_xp(user_id, guild_id, total_xp, time.time())
         
-        await self.db.update_user_data(
-            user_id, guild_id, new_xp, new_level, 
-            new_messages, time.time()
-        )
+        old_level = old_data['level']
+        new_xp = new_data['xp']
+        new_level = new_data['level']
+        new_messages = new_data['total_messages']
         
         level_up = new_level > old_level
         
+        MESSAGES_REWARDED.inc()
+        if level_up:
+            LEVEL_UPS.inc()
+        
         return {
             'old_level': old_level,
             'new_level': new_level,
@@ -70,42 +77,77 @@ class LevelingSystem:
             'total_messages': new_messages
         }
     
-    async def get_level_roles(self, guild_id: int) -> dict:
+    async def award_voice_xp(self, members: Mapping[int, Iterable[int]],
+                             minutes: float) -> List[Tuple[int, int, dict]]:
+        # members maps guild_id -> user_ids eligible for this tick; all of
+        # them are written in one batched transaction.
+        awards = {}
+        for guild_id, user_ids in members.items():
+            config = self.db.cached_guild_config(guild_id) or await self.db.get_guild_config(guild_id)
+            amount = int(config.voice_xp * minutes)
+            if amount > 0:
+                awards[guild_id] = dict.fromkeys(user_ids, amount)
+        
+        results = []
+        for user_id, guild_id, old_data, new_data in await self.db.award_voice_xp(awards, time.time()):
+            level_up = new_data['level'] > old_data['level']
+            if level_up:
+                LEVEL_UPS.inc()
+            
+            results.append((user_id, guild_id, {
+                'old_level': old_data['level'],
+                'new_level': new_data['level'],
+                'xp_gained': new_data['xp'] - old_data['xp'],
+                'total_xp': new_data['xp'],
+                'level_up': level_up,
+                'total_messages': new_data['total_messages']
+            }))
+        VOICE_AWARDS.inc(len(results))
+        return results
+    
+    async def get_level_roles(self, guild_id: int) -> LevelRoles:
         config = await self.db.get_guild_config(guild_id)
-        try:
-            return json.loads(config['level_roles'])
-        except (json.JSONDecodeError, TypeError):
-            return {}
+        return config.level_roles
     
     async def set_level_role(self, guild_id: int, level: int, role_id: int):
-        level_roles = await self.get_level_roles(guild_id)
-        level_roles[str(level)] = role_id
-        
-        config = await self.db.get_guild_config(guild_id)
-        config['level_roles'] = json.dumps(level_roles)
-        await self.db.update_guild_config(guild_id, **config)
+        level_roles = dict(await self.get_level_roles(guild_id))
+        level_roles[level] = role_id
+        await self.db.update_guild_config(guild_id, level_roles=level_roles)
     
     async def remove_level_role(self, guild_id: int, level: int):
-        level_roles = await self.get_level_roles(guild_id)
-        level_roles.pop(str(level), None)
-        
-        config = await self.db.get_guild_config(guild_id)
-        config['level_roles'] = json.dumps(level_roles)
-        await self.db.update_guild_config(guild_id, **config)
+        level_roles = dict(await self.get_level_roles(guild_id))
+        level_roles.pop(level, None)
+        await self.db.update_guild_config(guild_id, level_roles=level_roles)
     
-    def format_xp_progress(self, current_xp: int) -> dict:
-        current_level = self.calculate_level_from_xp(current_xp)
-        level_start_xp = self.calculate_xp_for_level(current_level)
-        next_level_xp = self.calculate_xp_for_level(current_level + 1)
-        
-        progress_xp = current_xp - level_start_xp
-        needed_xp = next_level_xp - level_start_xp
+    async def set_xp_curve(self, guild_id: int, spec) -> XPCurve:
+        config = await self.db.update_guild_config(guild_id, xp_curve=spec)
         
-        return {
-            'current_level': current_level,
-            'current_xp': current_xp,
-            'progress_xp': progress_xp,
-            'needed_xp': needed_xp,
-            'next_level_total_xp': next_level_xp,
-            'percentage': (progress_xp / needed_xp) * 100 if needed_xp > 0 else 100
-        }
+        # A newer curve supersedes any recalculation still running for the
+        # old one; the new pass covers every row again.
+        running = self.recalculations.pop(guild_id, None)
+        if running is not None:
+            running.cancel()
+        self.recalculations[guild_id] = asyncio.create_task(self._recalculate(guild_id))
+        return config.xp_curve
+    
+    async def _recalculate(self, guild_id: int):
+        try:
+            await self.db.recalculate_levels(guild_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            count_error("recalculate_levels")
+            print(f"Error recalculating levels for guild {guild_id}: {e}")
+        finally:
+            if self.recalculations.get(guild_id) is asyncio.current_task():
+                del self.recalculations[guild_id]
+    
+    async def stop(self):
+        tasks = list(self.recalculations.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.recalculations.clear()
+    
+    def format_xp_progress(self, current_xp: int, curve: XPCurve = DEFAULT_CURVE) -> dict:
+        return curve.progress(current_xp)
@@ -0,0 +1,184 @@
+import functools
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+INF_LABEL = 'le="+Inf"'
+
+def _label_text(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    __slots__ = ('value',)
+    
+    def __init__(self):
+        self.value = 0
+    
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+    
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+    
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation; precise
+        # enough to tell a 1ms path from a 100ms one.
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+class Family:
+    def __init__(self, name: str, help_text: str, kind: str, factory: Callable):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.factory = factory
+        self.children: Dict[Tuple[Tuple[str, str], ...], object] = {}
+    
+    def labels(self, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self.factory()
+        return child
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families: Dict[str, Family] = {}
+        self.gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+    
+    def _family(self, name: str, help_text: str, kind: str, factory: Callable) -> Family:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(name, help_text, kind, factory)
+        return family
+    
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._family(name, help_text, "counter", Counter).labels(**labels)
+    
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        return self._family(name, help_text, "histogram", Histogram).labels(**labels)
+    
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        self.gauges[name] = (help_text, read)
+    
+    def histograms(self, name: str, label: str) -> List[Tuple[str, Histogram]]:
+        family = self.families.get(name)
+        if family is None:
+            return []
+        return sorted(
+            (dict(labels).get(label, ""), child)
+            for labels, child in family.children.items()
+            if child.count
+        )
+    
+    def read_gauge(self, name: str) -> Optional[float]:
+        gauge = self.gauges.get(name)
+        if gauge is None:
+            return None
+        try:
+            return gauge[1]()
+        except Exception:
+            return None
+    
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in self.families.values():
+            lines.append(f"# HELP {family.name} {family.help_text}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for labels, child in family.children.items():
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_label_text(labels)} {child.value}")
+                    continue
+                
+                cumulative = 0
+                for bound, count in zip(child.bounds, child.counts):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{family.name}_bucket{_label_text(labels, le)} {cumulative}")
+                lines.append(f"{family.name}_bucket{_label_text(labels, INF_LABEL)} {child.count}")
+                lines.append(f"{family.name}_sum{_label_text(labels)} {child.total}")
+                lines.append(f"{family.name}_count{_label_text(labels)} {child.count}")
+        
+        for name, (help_text, _) in self.gauges.items():
+            value = self.read_gauge(name)
+            if value is None:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+MESSAGES_SEEN = metrics.counter("levelbot_messages_seen_total", "Guild messages from non-bot users")
+MESSAGES_COOLDOWN = metrics.counter("levelbot_messages_cooldown_rejected_total", "Messages rejected by the XP cooldown")
+MESSAGES_REPEATED = metrics.counter("levelbot_messages_repeat_rejected_total", "Messages denied XP as repeats")
+MESSAGES_REWARDED = metrics.counter("levelbot_messages_rewarded_total", "Messages that awarded XP")
+VOICE_AWARDS = metrics.counter("levelbot_voice_awards_total", "Voice XP awards to members")
+LEVEL_UPS = metrics.counter("levelbot_level_ups_total", "Level-ups detected")
+CONFIG_CACHE_HITS = metrics.counter("levelbot_cache_requests_total", "Cache lookups", cache="guild_config", result="hit")
+CONFIG_CACHE_MISSES = metrics.counter("levelbot_cache_requests_total", "Cache lookups", cache="guild_config", result="miss")
+RANK_INDEX_HITS = metrics.counter("levelbot_cache_requests_total", "Cache lookups", cache="rank_index", result="hit")
+RANK_INDEX_MISSES = metrics.counter("levelbot_cache_requests_total", "Cache lookups", cache="rank_index", result="miss")
+PERIOD_WINDOW_HITS = metrics.counter("levelbot_cache_requests_total", "Cache lookups", cache="period_window", result="hit")
+PERIOD_WINDOW_MISSES = metrics.counter("levelbot_cache_requests_total", "Cache lookups", cache="period_window", result="miss")
+
+def count_error(where: str):
+    metrics.counter("levelbot_errors_total", "Errors caught and logged", where=where).inc()
+
+def timed(name: str, help_text: str = "", **labels):
+    def decorator(func):
+        histogram = metrics.histogram(name, help_text, **labels)
+        
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def db_timed(method: str):
+    return timed("levelbot_db_seconds", "Database method latency", method=method)
+
+async def start_metrics_server(host: str, port: int):
+    from aiohttp import web
+    
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+    
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,373 @@
+import asyncio
+import json
+from contextlib import AbstractAsyncContextManager
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+import aiosqlite
+
+# Tables with fewer rows than this are rebuilt inside the migration itself;
+# larger ones are copied in the background by an online job.
+INLINE_COPY_ROWS = 50_000
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[aiosqlite.Connection], Awaitable[None]]
+
+async def schema_version(db: aiosqlite.Connection) -> int:
+    async with db.execute("PRAGMA user_version") as cursor:
+        return (await cursor.fetchone())[0]
+
+async def _columns(db: aiosqlite.Connection, table: str) -> set:
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        return {row[1] for row in await cursor.fetchall()}
+
+async def baseline(db: aiosqlite.Connection):
+    # The schema as it stood before versioning, including the columns and
+    # tables earlier releases added on startup, so every existing database
+    # reaches the same version 1.
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS user_levels (
+            user_id INTEGER,
+            guild_id INTEGER,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 0,
+            total_messages INTEGER DEFAULT 0,
+            last_message_time REAL DEFAULT 0,
+            PRIMARY KEY (user_id, guild_id)
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_guild_xp ON user_levels(guild_id, xp DESC)
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS guild_config (
+            guild_id INTEGER PRIMARY KEY,
+            xp_per_message INTEGER DEFAULT 15,
+            xp_cooldown INTEGER DEFAULT 60,
+            level_up_channel INTEGER,
+            level_roles TEXT DEFAULT '{}',
+            announcement_enabled INTEGER DEFAULT 1,
+            xp_curve TEXT
+        )
+    ''')
+    
+    if 'xp_curve' not in await _columns(db, 'guild_config'):
+        await db.execute("ALTER TABLE guild_config ADD COLUMN xp_curve TEXT")
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS role_backfill_jobs (
+            guild_id INTEGER PRIMARY KEY,
+            last_user_id INTEGER DEFAULT 0,
+            processed INTEGER DEFAULT 0,
+            updated INTEGER DEFAULT 0,
+            channel_id INTEGER,
+            message_id INTEGER,
+            started_at REAL DEFAULT 0
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS user_names (
+            guild_id INTEGER,
+            user_id INTEGER,
+            display_name TEXT,
+            updated_at REAL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS xp_daily (
+            guild_id INTEGER,
+            day INTEGER,
+            user_id INTEGER,
+            xp INTEGER DEFAULT 0,
+            messages INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, day, user_id)
+        ) WITHOUT ROWID
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS journal_state (
+            id INTEGER PRIMARY KEY,
+            last_seq INTEGER DEFAULT 0
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS xp_audit (
+            journal_id INTEGER,
+            seq INTEGER,
+            guild_id INTEGER,
+            user_id INTEGER,
+            actor_id INTEGER,
+            source INTEGER,
+            amount INTEGER,
+            timestamp REAL,
+            PRIMARY KEY (journal_id, seq)
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_audit_guild ON xp_audit(guild_id, timestamp)
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS migration_jobs (
+            name TEXT PRIMARY KEY,
+            cursor INTEGER DEFAULT 0,
+            copied INTEGER DEFAULT 0
+        )
+    ''')
+
+async def copy_user_levels(db: aiosqlite.Connection, after: int, limit: int) -> Optional[Tuple[int, int]]:
+    async with db.execute('''
+        SELECT MAX(rowid), COUNT(*) FROM (
+            SELECT rowid FROM user_levels WHERE rowid > ? ORDER BY rowid LIMIT ?
+        )
+    ''', (after, limit)) as cursor:
+        last, count = await cursor.fetchone()
+    if last is None:
+        return None
+    
+    # Rows the triggers already mirrored are at least as new as the copy.
+    await db.execute('''
+        INSERT OR IGNORE INTO user_levels_compact
+        (guild_id, user_id, xp, level, total_messages, last_message_time)
+        SELECT guild_id, user_id, xp, level, total_messages, last_message_time
+        FROM user_levels
+        WHERE rowid > ? AND rowid <= ?
+    ''', (after, last))
+    return last, count
+
+async def swap_user_levels(db: aiosqlite.Connection):
+    for trigger in ('insert', 'update', 'delete'):
+        await db.execute(f"DROP TRIGGER IF EXISTS user_levels_compact_{trigger}")
+    await db.execute("DROP TABLE user_levels")
+    await db.execute("ALTER TABLE user_levels_compact RENAME TO user_levels")
+
+async def compact_layout(db: aiosqlite.Connection):
+    # Level roles move out of the JSON column into rows of their own.
+    await db.execute('''
+        CREATE TABLE level_roles (
+            guild_id INTEGER,
+            level INTEGER,
+            role_id INTEGER,
+            PRIMARY KEY (guild_id, level)
+        ) WITHOUT ROWID
+    ''')
+    
+    roles = []
+    async with db.execute("SELECT guild_id, level_roles FROM guild_config") as cursor:
+        async for guild_id, raw in cursor:
+            try:
+                pairs = json.loads(raw or '{}')
+                roles.extend((guild_id, int(level), int(role_id)) for level, role_id in pairs.items())
+            except (ValueError, TypeError, AttributeError):
+                print(f"Skipping unreadable level roles for guild {guild_id}")
+    await db.executemany("INSERT OR IGNORE INTO level_roles (guild_id, level, role_id) VALUES (?, ?, ?)", roles)
+    
+    await db.execute('''
+        CREATE TABLE guild_config_new (
+            guild_id INTEGER PRIMARY KEY,
+            xp_per_message INTEGER DEFAULT 15,
+            xp_cooldown INTEGER DEFAULT 60,
+            level_up_channel INTEGER,
+            announcement_enabled INTEGER DEFAULT 1,
+            xp_curve TEXT
+        )
+    ''')
+    await db.execute('''
+        INSERT INTO guild_config_new
+        SELECT guild_id, xp_per_message, xp_cooldown, level_up_channel, announcement_enabled, xp_curve
+        FROM guild_config
+    ''')
+    await db.execute("DROP TABLE guild_config")
+    await db.execute("ALTER TABLE guild_config_new RENAME TO guild_config")
+    
+    # The primary key already covers (user_id, guild_id) lookups.
+    await db.execute("DROP INDEX IF EXISTS idx_user_guild")
+    
+    # user_levels is rebuilt keyed on (guild_id, user_id) without a rowid, so
+    # a guild's members are stored together; the index holds everything the
+    # leaderboard and rank queries read.
+    await db.execute('''
+        CREATE TABLE user_levels_compact (
+            guild_id INTEGER,
+            user_id INTEGER,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 0,
+            total_messages INTEGER DEFAULT 0,
+            last_message_time REAL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    
+    await db.execute('''
+        CREATE INDEX idx_levels_rank ON user_levels_compact(guild_id, xp DESC, user_id, level, total_messages)
+    ''')
+    
+    # Until the swap, every write to the old table is mirrored into the new
+    # one, so the bot keeps running on the old layout while it is copied.
+    # The mirror is an upsert: an OR REPLACE inside a trigger is overridden
+    # by the conflict policy of the statement that fired it.
+    mirror = """
+        INSERT INTO user_levels_compact
+        (guild_id, user_id, xp, level, total_messages, last_message_time)
+        VALUES (NEW.guild_id, NEW.user_id, NEW.xp, NEW.level, NEW.total_messages, NEW.last_message_time)
+        ON CONFLICT(guild_id, user_id) DO UPDATE SET
+            xp = excluded.xp,
+            level = excluded.level,
+            total_messages = excluded.total_messages,
+            last_message_time = excluded.last_message_time
+    """
+    for trigger, event, statement in (
+        ('insert', 'INSERT', mirror),
+        ('update', 'UPDATE', mirror),
+        ('delete', 'DELETE', 'DELETE FROM user_levels_compact WHERE guild_id = OLD.guild_id AND user_id = OLD.user_id')
+    ):
+        await db.execute(f'''
+            CREATE TRIGGER user_levels_compact_{trigger} AFTER {event} ON user_levels
+            BEGIN {statement}; END
+        ''')
+    
+    async with db.execute('''
+        SELECT COUNT(*) FROM (SELECT 1 FROM user_levels LIMIT ?)
+    ''', (INLINE_COPY_ROWS + 1,)) as cursor:
+        small = (await cursor.fetchone())[0] <= INLINE_COPY_ROWS
+    if small:
+        await copy_user_levels(db, 0, INLINE_COPY_ROWS)
+        await swap_user_levels(db)
+    else:
+        await db.execute("INSERT INTO migration_jobs (name) VALUES ('user_levels_compact')")
+
+async def server_stats(db: aiosqlite.Connection):
+    # While the compact rebuild is still copying, the statistics follow the
+    # new table; its triggers move with it when the tables are swapped.
+    async with db.execute("SELECT 1 FROM migration_jobs WHERE name = 'user_levels_compact'") as cursor:
+        table = 'user_levels_compact' if await cursor.fetchone() else 'user_levels'
+    
+    await db.execute('''
+        CREATE TABLE guild_stats (
+            guild_id INTEGER PRIMARY KEY,
+            total_xp INTEGER DEFAULT 0,
+            members INTEGER DEFAULT 0,
+            total_messages INTEGER DEFAULT 0
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE level_histogram (
+            guild_id INTEGER,
+            level INTEGER,
+            members INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, level)
+        ) WITHOUT ROWID
+    ''')
+    
+    # The only full pass over the table; from here on the triggers below
+    # keep both aggregates current in the same transaction as each write.
+    await db.execute(f'''
+        INSERT INTO guild_stats (guild_id, total_xp, members, total_messages)
+        SELECT guild_id, SUM(xp), COUNT(*), SUM(total_messages) FROM {table} GROUP BY guild_id
+    ''')
+    await db.execute(f'''
+        INSERT INTO level_histogram (guild_id, level, members)
+        SELECT guild_id, level, COUNT(*) FROM {table} GROUP BY guild_id, level
+    ''')
+    
+    add_member = '''
+        INSERT INTO guild_stats (guild_id, total_xp, members, total_messages)
+        VALUES (NEW.guild_id, NEW.xp, 1, NEW.total_messages)
+        ON CONFLICT(guild_id) DO UPDATE SET
+            total_xp = total_xp + excluded.total_xp,
+            members = members + 1,
+            total_messages = total_messages + excluded.total_messages;
+        INSERT INTO level_histogram (guild_id, level, members) VALUES (NEW.guild_id, NEW.level, 1)
+        ON CONFLICT(guild_id, level) DO UPDATE SET members = members + 1
+    '''
+    remove_member = '''
+        UPDATE guild_stats SET
+            total_xp = total_xp - OLD.xp,
+            members = members - 1,
+            total_messages = total_messages - OLD.total_messages
+        WHERE guild_id = OLD.guild_id;
+        UPDATE level_histogram SET members = members - 1 WHERE guild_id = OLD.guild_id AND level = OLD.level
+    '''
+    update_totals = '''
+        UPDATE guild_stats SET
+            total_xp = total_xp + NEW.xp - OLD.xp,
+            total_messages = total_messages + NEW.total_messages - OLD.total_messages
+        WHERE guild_id = NEW.guild_id
+    '''
+    move_level = '''
+        UPDATE level_histogram SET members = members - 1 WHERE guild_id = OLD.guild_id AND level = OLD.level;
+        INSERT INTO level_histogram (guild_id, level, members) VALUES (NEW.guild_id, NEW.level, 1)
+        ON CONFLICT(guild_id, level) DO UPDATE SET members = members + 1
+    '''
+    for name, event, body in (
+        ('insert', f'INSERT ON {table}', add_member),
+        ('delete', f'DELETE ON {table}', remove_member),
+        ('update', f'UPDATE OF xp, total_messages ON {table}', update_totals),
+        ('level', f'UPDATE OF level ON {table} WHEN OLD.level != NEW.level', move_level)
+    ):
+        await db.execute(f'''
+            CREATE TRIGGER user_levels_stats_{name} AFTER {event}
+            BEGIN {body}; END
+        ''')
+
+async def voice_xp(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE guild_config ADD COLUMN voice_xp INTEGER DEFAULT 5")
+
+MIGRATIONS = (
+    Migration(1, "baseline schema", baseline),
+    Migration(2, "compact user_levels layout and level_roles table", compact_layout),
+    Migration(3, "incrementally maintained guild statistics", server_stats),
+    Migration(4, "per-guild voice XP rate", voice_xp),
+)
+
+# Online jobs copy one chunk per call, returning (cursor, rows copied) or
+# None when done, and are finished by a swap in the last transaction.
+ONLINE_JOBS: Dict[str, Tuple[Callable, Callable]] = {
+    'user_levels_compact': (copy_user_levels, swap_user_levels),
+}
+
+async def apply_migration(db: aiosqlite.Connection, migration: Migration) -> bool:
+    # BEGIN IMMEDIATE takes SQLite's write lock before the version is read,
+    # so when several processes start at once only one applies each step.
+    await db.execute("BEGIN IMMEDIATE")
+    if await schema_version(db) >= migration.version:
+        return False
+    await migration.apply(db)
+    await db.execute(f"PRAGMA user_version = {migration.version}")
+    return True
+
+async def run_online_jobs(write: Callable[[], AbstractAsyncContextManager], chunk_size: int = 5000,
+                          pause: float = 0.05) -> int:
+    # Every chunk is its own short write transaction that reads and advances
+    # the job's cursor, so jobs resume after a restart and processes that
+    # run them at the same time just share the work.
+    finished = 0
+    while True:
+        async with write() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute("SELECT name, cursor FROM migration_jobs ORDER BY name LIMIT 1") as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return finished
+            
+            name, after = row
+            copy, finish = ONLINE_JOBS[name]
+            result = await copy(db, after, chunk_size)
+            if result is None:
+                await finish(db)
+                await db.execute("DELETE FROM migration_jobs WHERE name = ?", (name,))
+                finished += 1
+                print(f"Finished online migration {name}")
+            else:
+                await db.execute('''
+                    UPDATE migration_jobs SET cursor = ?, copied = copied + ? WHERE name = ?
+                ''', (result[0], result[1], name))
+        await asyncio.sleep(pause)
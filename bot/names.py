@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import discord
+from .metrics import metrics, count_error
+
+QUERY_CHUNK = 100
+
+class NameResolver:
+    def __init__(self, bot, max_names: int = 100_000, ttl: float = 3600.0, missing_ttl: float = 300.0,
+                 query_timeout: float = 2.0, persist: bool = True):
+        self.bot = bot
+        self.max_names = max_names
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.query_timeout = query_timeout
+        self.persist = persist
+        self._names: 'OrderedDict[Tuple[int, int], Tuple[Optional[str], float]]' = OrderedDict()
+        
+        self.hits = metrics.counter("levelbot_name_cache_hits_total", "Display names served from the name cache")
+        self.misses = metrics.counter("levelbot_name_cache_misses_total", "Display names not in the name cache")
+        self.queried = metrics.counter("levelbot_name_queries_total", "Member chunk requests sent to resolve names")
+    
+    def __len__(self) -> int:
+        return len(self._names)
+    
+    def remember(self, member: discord.Member):
+        self._store(member.guild.id, member.id, member.display_name, self.ttl)
+    
+    def forget(self, guild_id: int, user_id: int):
+        self._names.pop((guild_id, user_id), None)
+    
+    def _store(self, guild_id: int, user_id: int, name: Optional[str], ttl: float):
+        key = (guild_id, user_id)
+        self._names[key] = (name, time.monotonic() + ttl)
+        self._names.move_to_end(key)
+        while len(self._names) > self.max_names:
+            self._names.popitem(last=False)
+    
+    def _cached(self, guild_id: int, user_id: int, now: float) -> Tuple[bool, Optional[str]]:
+        key = (guild_id, user_id)
+        entry = self._names.get(key)
+        if entry is None:
+            return False, None
+        if entry[1] <= now:
+            del self._names[key]
+            return False, None
+        self._names.move_to_end(key)
+        return True, entry[0]
+    
+    async def resolve(self, guild: discord.Guild, user_ids: Iterable[int]) -> Dict[int, str]:
+        names: Dict[int, str] = {}
+        fresh: Dict[int, str] = {}
+        missing: List[int] = []
+        now = time.monotonic()
+        
+        for user_id in user_ids:
+            found, name = self._cached(guild.id, user_id, now)
+            if found:
+                self.hits.inc()
+                if name is not None:
+                    names[user_id] = name
+                continue
+            
+            self.misses.inc()
+            member = guild.get_member(user_id)
+            if member is not None:
+                fresh[user_id] = member.display_name
+                self._store(guild.id, user_id, member.display_name, self.ttl)
+            else:
+                missing.append(user_id)
+        
+        if missing:
+            fresh.update(await self._query(guild, missing))
+        names.update(fresh)
+        
+        unresolved = [user_id for user_id in missing if user_id not in fresh]
+        stored = {}
+        if unresolved and self.persist:
+            # Members who left the guild keep the name they were last seen with.
+            stored = await self.bot.db.get_display_names(guild.id, unresolved)
+            names.update(stored)
+        
+        for user_id in unresolved:
+            self._store(guild.id, user_id, stored.get(user_id), self.missing_ttl)
+        
+        if fresh and self.persist:
+            try:
+                await self.bot.db.save_display_names(guild.id, fresh)
+            except Exception as e:
+                count_error("names")
+                print(f"Error saving display names: {e}")
+        
+        return names
+    
+    async def _query(self, guild: discord.Guild, user_ids: List[int]) -> Dict[int, str]:
+        names = {}
+        for start in range(0, len(user_ids), QUERY_CHUNK):
+            chunk = user_ids[start:start + QUERY_CHUNK]
+            self.queried.inc()
+            try:
+                # cache=False: the resolver keeps the name, not the whole
+                # Member object, so the member cache does not grow.
+                members = await asyncio.wait_for(
+                    guild.query_members(user_ids=chunk, limit=len(chunk), cache=False),
+                    self.query_timeout
+                )
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                count_error("names")
+                print(f"Error querying guild members: {e}")
+                break
+            
+            for member in members:
+                names[member.id] = member.display_name
+                self._store(guild.id, member.id, member.display_name, self.ttl)
+        return names
@@ -0,0 +1,167 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Each tracked member costs two 8-byte array slots (negated XP and user id),
+# i.e. 16 bytes, plus amortised array over-allocation.
+BYTES_PER_MEMBER = 16
+
+class GuildRankIndex:
+    __slots__ = ('_neg_xp', '_user_ids')
+    
+    def __init__(self, rows: Iterable[Tuple[int, int]] = ()):
+        # Rows must already be ordered by xp DESC, user_id ASC.
+        self._neg_xp = array('q')
+        self._user_ids = array('q')
+        for user_id, xp in rows:
+            self._neg_xp.append(-xp)
+            self._user_ids.append(user_id)
+    
+    def __len__(self) -> int:
+        return len(self._user_ids)
+    
+    def _position(self, user_id: int, xp: int) -> int:
+        lo = bisect_left(self._neg_xp, -xp)
+        hi = bisect_right(self._neg_xp, -xp, lo)
+        return bisect_left(self._user_ids, user_id, lo, hi)
+    
+    def find(self, user_id: int, xp: int) -> int:
+        i = self._position(user_id, xp)
+        if i < len(self._user_ids) and self._user_ids[i] == user_id and self._neg_xp[i] == -xp:
+            return i
+        return -1
+    
+    def insert(self, user_id: int, xp: int):
+        i = self._position(user_id, xp)
+        self._neg_xp.insert(i, -xp)
+        self._user_ids.insert(i, user_id)
+    
+    def update(self, user_id: int, old_xp: int, new_xp: int) -> bool:
+        i = self.find(user_id, old_xp)
+        if i < 0:
+            # Members without a row read as 0 XP and are not indexed yet;
+            # anyone else missing from their old position means drift.
+            if old_xp != 0:
+                return False
+            self.insert(user_id, new_xp)
+            return True
+        if old_xp == new_xp:
+            return True
+        
+        # Shift only the members between the old and new position, which is
+        # a short slice for the usual small XP gain.
+        neg_xp, user_ids = self._neg_xp, self._user_ids
+        if new_xp > old_xp:
+            lo = bisect_left(neg_xp, -new_xp, 0, i)
+            hi = bisect_right(neg_xp, -new_xp, lo, i)
+            j = bisect_left(user_ids, user_id, lo, hi)
+            neg_xp[j + 1:i + 1] = neg_xp[j:i]
+            user_ids[j + 1:i + 1] = user_ids[j:i]
+        else:
+            lo = bisect_left(neg_xp, -new_xp, i + 1)
+            hi = bisect_right(neg_xp, -new_xp, lo)
+            j = bisect_left(user_ids, user_id, lo, hi) - 1
+            neg_xp[i:j] = neg_xp[i + 1:j + 1]
+            user_ids[i:j] = user_ids[i + 1:j + 1]
+        neg_xp[j] = -new_xp
+        user_ids[j] = user_id
+        return True
+    
+    def rank(self, xp: int) -> int:
+        return bisect_left(self._neg_xp, -xp) + 1
+    
+    def slice(self, offset: int, limit: int) -> List[Tuple[int, int]]:
+        end = offset + limit
+        return list(zip(self._user_ids[offset:end], (-x for x in self._neg_xp[offset:end])))
+    
+    def page_after(self, xp: int, user_id: int, limit: int) -> List[Tuple[int, int]]:
+        i = self._position(user_id, xp)
+        if self.find(user_id, xp) == i:
+            i += 1
+        return self.slice(i, limit)
+    
+    def page_before(self, xp: int, user_id: int, limit: int) -> List[Tuple[int, int]]:
+        i = self._position(user_id, xp)
+        start = max(0, i - limit)
+        return self.slice(start, i - start)
+    
+    def around(self, user_id: int, xp: int, radius: int) -> Tuple[int, List[Tuple[int, int]]]:
+        i = self.find(user_id, xp)
+        if i < 0:
+            i = self._position(user_id, xp)
+        start = max(0, i - radius)
+        return start + 1, self.slice(start, 2 * radius + 1)
+
+class RankIndex:
+    def __init__(self, max_guild_members: int = 1_000_000, max_tracked_members: int = 4_000_000):
+        self.max_guild_members = max_guild_members
+        self.max_tracked_members = max_tracked_members
+        self.guilds: 'OrderedDict[int, GuildRankIndex]' = OrderedDict()
+        self.oversized: set = set()
+        self._building: Dict[int, Dict[int, int]] = {}
+        self._tracked = 0
+    
+    @property
+    def tracked_members(self) -> int:
+        return self._tracked
+    
+    def get(self, guild_id: int) -> Optional[GuildRankIndex]:
+        index = self.guilds.get(guild_id)
+        if index is not None:
+            self.guilds.move_to_end(guild_id)
+        return index
+    
+    def is_building(self, guild_id: int) -> bool:
+        return guild_id in self._building
+    
+    def begin_build(self, guild_id: int):
+        self._building[guild_id] = {}
+    
+    def abort_build(self, guild_id: int, oversized: bool = False):
+        self._building.pop(guild_id, None)
+        if oversized:
+            self.oversized.add(guild_id)
+    
+    def finish_build(self, guild_id: int, rows: List[Tuple[int, int]]) -> GuildRankIndex:
+        # Writes that landed while rows were loading win over the loaded
+        # values, whichever side of the read they happened on.
+        dirty = self._building.pop(guild_id, {})
+        if dirty:
+            rows = [row for row in rows if row[0] not in dirty]
+        index = GuildRankIndex(rows)
+        for user_id, xp in dirty.items():
+            index.insert(user_id, xp)
+        
+        self.guilds[guild_id] = index
+        self._tracked += len(index)
+        self._enforce_cap()
+        return index
+    
+    def record(self, guild_id: int, user_id: int, old_xp: int, new_xp: int):
+        dirty = self._building.get(guild_id)
+        if dirty is not None:
+            dirty[user_id] = new_xp
+            return
+        
+        index = self.guilds.get(guild_id)
+        if index is None:
+            return
+        
+        size = len(index)
+        if not index.update(user_id, old_xp, new_xp):
+            self.drop(guild_id)
+        elif len(index) != size:
+            self._tracked += 1
+            self._enforce_cap()
+    
+    def drop(self, guild_id: int):
+        index = self.guilds.pop(guild_id, None)
+        if index is not None:
+            self._tracked -= len(index)
+        self.oversized.discard(guild_id)
+    
+    def _enforce_cap(self):
+        while self._tracked > self.max_tracked_members and len(self.guilds) > 1:
+            guild_id, index = self.guilds.popitem(last=False)
+            self._tracked -= len(index)
@@ -0,0 +1,133 @@
+import sqlite3
+from typing import Callable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .curves import DEFAULT_CURVE, XPCurve, parse_curve
+
+# Rows are (user_id, guild_id, xp, level). Both passes walk the
+# (guild_id, user_id) primary key, so every chunk is a seek from the cursor
+# and rows whose XP changes mid-pass are neither skipped nor revisited.
+SCAN_ALL = '''
+    SELECT user_id, guild_id, xp, level
+    FROM user_levels
+    ORDER BY guild_id, user_id
+    LIMIT ?
+'''
+
+SCAN_ALL_AFTER = '''
+    SELECT user_id, guild_id, xp, level
+    FROM user_levels
+    WHERE (guild_id, user_id) > (?, ?)
+    ORDER BY guild_id, user_id
+    LIMIT ?
+'''
+
+SCAN_GUILD = '''
+    SELECT user_id, guild_id, xp, level
+    FROM user_levels
+    WHERE guild_id = ?
+    ORDER BY user_id
+    LIMIT ?
+'''
+
+SCAN_GUILD_AFTER = '''
+    SELECT user_id, guild_id, xp, level
+    FROM user_levels
+    WHERE guild_id = ? AND user_id > ?
+    ORDER BY user_id
+    LIMIT ?
+'''
+
+UPDATE_LEVEL = 'UPDATE user_levels SET level = ? WHERE user_id = ? AND guild_id = ?'
+
+def scan_statement(guild_id: Optional[int], after, limit: int) -> Tuple[str, tuple]:
+    if guild_id is None:
+        if after is None:
+            return SCAN_ALL, (limit,)
+        return SCAN_ALL_AFTER, (after[0], after[1], limit)
+    if after is None:
+        return SCAN_GUILD, (guild_id, limit)
+    return SCAN_GUILD_AFTER, (guild_id, after, limit)
+
+def scan_cursor(guild_id: Optional[int], rows: Sequence[tuple]):
+    last = rows[-1]
+    return (last[1], last[0]) if guild_id is None else last[0]
+
+def _search(curve: XPCurve, xp):
+    thresholds = numpy.frombuffer(curve.thresholds, dtype=numpy.int64)
+    return numpy.maximum(numpy.searchsorted(thresholds, xp, side='right') - 1, 0)
+
+def level_changes(rows: Sequence[tuple], curve_for: Callable[[int], XPCurve]) -> List[Tuple[int, int, int]]:
+    if not rows:
+        return []
+    
+    if numpy is None:
+        changes = []
+        for user_id, guild_id, xp, level in rows:
+            new_level = curve_for(guild_id).level_for(xp)
+            if new_level != level:
+                changes.append((new_level, user_id, guild_id))
+        return changes
+    
+    count = len(rows)
+    xp = numpy.fromiter((row[2] for row in rows), dtype=numpy.int64, count=count)
+    stored = numpy.fromiter((row[3] for row in rows), dtype=numpy.int64, count=count)
+    row_curves = [curve_for(row[1]) for row in rows]
+    
+    # Most guilds share a handful of compiled curves, so the chunk is split
+    # per curve rather than per guild.
+    distinct = {id(curve): curve for curve in row_curves}
+    if len(distinct) == 1:
+        levels = _search(row_curves[0], xp)
+    else:
+        owners = numpy.fromiter((id(curve) for curve in row_curves), dtype=numpy.int64, count=count)
+        levels = numpy.empty(count, dtype=numpy.int64)
+        for key, curve in distinct.items():
+            mask = owners == key
+            levels[mask] = _search(curve, xp[mask])
+    
+    return [
+        (int(levels[i]), rows[i][0], rows[i][1])
+        for i in numpy.flatnonzero(levels != stored).tolist()
+    ]
+
+def load_curves(db: sqlite3.Connection) -> dict:
+    columns = {row[1] for row in db.execute("PRAGMA table_info(guild_config)")}
+    if 'xp_curve' not in columns:
+        return {}
+    return {
+        guild_id: parse_curve(raw)
+        for guild_id, raw in db.execute("SELECT guild_id, xp_curve FROM guild_config")
+    }
+
+def recompute_offline(db_path: str, guild_id: Optional[int] = None, chunk_size: int = 100_000,
+                      dry_run: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int]:
+    db = sqlite3.connect(db_path)
+    try:
+        db.execute("PRAGMA busy_timeout = 5000")
+        curves = load_curves(db)
+        curve_for = lambda guild: curves.get(guild, DEFAULT_CURVE)
+        
+        scanned = changed = 0
+        after = None
+        while True:
+            rows = db.execute(*scan_statement(guild_id, after, chunk_size)).fetchall()
+            changes = level_changes(rows, curve_for)
+            if changes and not dry_run:
+                with db:
+                    db.executemany(UPDATE_LEVEL, changes)
+            
+            scanned += len(rows)
+            changed += len(changes)
+            if progress is not None:
+                progress(scanned, changed)
+            
+            if len(rows) < chunk_size:
+                return scanned, changed
+            after = scan_cursor(guild_id, rows)
+    finally:
+        db.close()
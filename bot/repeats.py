@@ -0,0 +1,56 @@
+import heapq
+import string
+import zlib
+from typing import Optional, Tuple
+from .cooldowns import CooldownWheel
+
+Signature = Tuple[int, ...]
+
+SKETCH_SIZE = 8
+MAX_CHARS = 512
+PUNCTUATION = str.maketrans({c: " " for c in string.punctuation})
+
+def signature(content: str) -> Signature:
+    # Bottom-k MinHash of the message's distinct words: the k smallest word
+    # hashes. At most MAX_CHARS are read and the work happens in C string,
+    # CRC and heap routines, so a signature takes microseconds. CRC-32 is
+    # used rather than hash() so signatures do not change between runs.
+    words = set(content[:MAX_CHARS].lower().translate(PUNCTUATION).split())
+    if not words:
+        return (zlib.crc32(content[:MAX_CHARS].encode()),)
+    return tuple(heapq.nsmallest(SKETCH_SIZE, [zlib.crc32(word.encode()) for word in words]))
+
+def similarity(a: Signature, b: Signature) -> float:
+    if a == b:
+        return 1.0
+    
+    # Estimates the Jaccard similarity of the two word sets from the k
+    # smallest hashes of their union.
+    union = heapq.nsmallest(SKETCH_SIZE, set(a).union(b))
+    shared = sum(1 for value in union if value in a and value in b)
+    return shared / len(union)
+
+class RepeatFilter:
+    def __init__(self, cooldowns: CooldownWheel, history: int = 4,
+                 duplicate_threshold: float = 0.85, similar_threshold: float = 0.5):
+        self.cooldowns = cooldowns
+        self.history = history
+        self.duplicate_threshold = duplicate_threshold
+        self.similar_threshold = similar_threshold
+    
+    def check(self, key: int, content: str) -> float:
+        # Returns the share of XP a message earns: nothing for a repeat of
+        # one of the member's last few rewarded messages, less the closer it
+        # is for a near-duplicate. The ring is state attached to the
+        # member's cooldown entry and is dropped when that entry expires.
+        current = signature(content)
+        ring: Optional[Tuple[Signature, ...]] = self.cooldowns.get_state(key)
+        closest = max((similarity(current, previous) for previous in ring), default=0.0) if ring else 0.0
+        
+        self.cooldowns.set_state(key, ((current,) + ring)[:self.history] if ring else (current,))
+        
+        if closest >= self.duplicate_threshold:
+            return 0.0
+        if closest >= self.similar_threshold:
+            return 1.0 - closest
+        return 1.0
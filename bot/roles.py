@@ -0,0 +1,43 @@
+from bisect import bisect_right
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+class LevelRoles(Mapping):
+    __slots__ = ('levels', 'role_ids', 'role_id_set')
+    
+    def __init__(self, pairs: Mapping[int, int] = None):
+        items = sorted((int(level), int(role_id)) for level, role_id in (pairs or {}).items())
+        self.levels: Tuple[int, ...] = tuple(level for level, _ in items)
+        self.role_ids: Tuple[int, ...] = tuple(role_id for _, role_id in items)
+        self.role_id_set = frozenset(self.role_ids)
+    
+    def __getitem__(self, level: int) -> int:
+        i = bisect_right(self.levels, level) - 1
+        if i < 0 or self.levels[i] != level:
+            raise KeyError(level)
+        return self.role_ids[i]
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.levels)
+    
+    def __len__(self) -> int:
+        return len(self.levels)
+    
+    def __repr__(self) -> str:
+        return f"LevelRoles({dict(zip(self.levels, self.role_ids))})"
+    
+    def roles_for(self, level: int) -> Tuple[int, ...]:
+        return self.role_ids[:bisect_right(self.levels, level)]
+
+def reconcile_member_roles(member, level_roles: LevelRoles, level: int) -> Optional[List]:
+    guild = member.guild
+    current = [role for role in member.roles if not role.is_default()]
+    
+    roles = [role for role in current if role.id not in level_roles.role_id_set]
+    for role_id in level_roles.roles_for(level):
+        role = guild.get_role(role_id)
+        if role is not None:
+            roles.append(role)
+    
+    if {role.id for role in roles} == {role.id for role in current}:
+        return None
+    return roles
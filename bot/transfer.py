@@ -0,0 +1,176 @@
+import csv
+import io
+import itertools
+import json
+import sqlite3
+from typing import Callable, Iterable, Iterator, Mapping, Optional, TextIO, Tuple
+
+from .curves import DEFAULT_CURVE
+from .recompute import load_curves
+
+FIELDS = ('user_id', 'guild_id', 'xp', 'level', 'total_messages', 'last_message_time')
+IMPORT_MODES = ("upsert", "overwrite")
+
+IMPORT_ROW = '''
+    INSERT INTO user_levels
+    (user_id, guild_id, xp, level, total_messages, last_message_time)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, guild_id) DO UPDATE SET
+        xp = excluded.xp,
+        level = excluded.level,
+        total_messages = excluded.total_messages,
+        last_message_time = excluded.last_message_time
+'''
+
+def read_csv(stream: TextIO) -> Iterator[Optional[Mapping]]:
+    return csv.DictReader(stream)
+
+def read_ndjson(stream: TextIO) -> Iterator[Optional[Mapping]]:
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+
+def _mee6_pages(document) -> Iterator[Mapping]:
+    if isinstance(document, list):
+        for page in document:
+            yield from _mee6_pages(page)
+    elif isinstance(document, Mapping):
+        yield document
+
+def read_mee6(stream: TextIO) -> Iterator[Optional[Mapping]]:
+    # MEE6 leaderboard dumps are one or more API pages, either as a single
+    # JSON document or one page per line:
+    # {"guild": {"id": ...}, "players": [{"id", "xp", "message_count", ...}]}
+    # A first line that parses on its own means one page per line, and the
+    # rest is read a page at a time; only a multi-line document is loaded
+    # whole.
+    first = stream.readline()
+    while first and not first.strip():
+        first = stream.readline()
+    try:
+        documents = itertools.chain([json.loads(first)], read_ndjson(stream))
+    except json.JSONDecodeError:
+        text = first + stream.read()
+        try:
+            documents = [json.loads(text)]
+        except json.JSONDecodeError:
+            documents = read_ndjson(io.StringIO(text))
+    
+    for document in documents:
+        if document is None:
+            yield None
+            continue
+        for page in _mee6_pages(document):
+            guild_id = (page.get('guild') or {}).get('id')
+            for player in page.get('players', ()):
+                if not isinstance(player, Mapping):
+                    yield None
+                    continue
+                yield {
+                    'user_id': player.get('id'),
+                    'guild_id': guild_id,
+                    'xp': player.get('xp'),
+                    'total_messages': player.get('message_count')
+                }
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+    'mee6': read_mee6
+}
+
+def parse_record(record: Mapping, guild_id: Optional[int] = None) -> Tuple[int, int, int, int, float]:
+    user_id = int(record['user_id'])
+    guild = guild_id if guild_id is not None else int(record['guild_id'])
+    xp = int(record['xp'])
+    if xp < 0:
+        raise ValueError("negative XP")
+    total_messages = int(record.get('total_messages') or 0)
+    last_message_time = float(record.get('last_message_time') or 0)
+    return user_id, guild, xp, total_messages, last_message_time
+
+def import_records(db_path: str, records: Iterable[Optional[Mapping]], guild_id: Optional[int] = None,
+                   mode: str = "upsert", chunk_size: int = 50_000,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int]:
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode: {mode}")
+    
+    db = sqlite3.connect(db_path)
+    try:
+        db.execute("PRAGMA busy_timeout = 5000")
+        curves = load_curves(db)
+        cleared = set()
+        imported = skipped = 0
+        chunk = []
+        
+        def write(chunk):
+            with db:
+                if mode == "overwrite":
+                    # A guild's old rows go in the same transaction as its
+                    # first imported chunk.
+                    for guild in {row[1] for row in chunk} - cleared:
+                        db.execute("DELETE FROM user_levels WHERE guild_id = ?", (guild,))
+                        cleared.add(guild)
+                db.executemany(IMPORT_ROW, chunk)
+        
+        for record in records:
+            try:
+                user_id, guild, xp, total_messages, last_message_time = parse_record(record, guild_id)
+            except (KeyError, TypeError, ValueError, AttributeError):
+                skipped += 1
+                continue
+            
+            level = curves.get(guild, DEFAULT_CURVE).level_for(xp)
+            chunk.append((user_id, guild, xp, level, total_messages, last_message_time))
+            if len(chunk) >= chunk_size:
+                write(chunk)
+                imported += len(chunk)
+                chunk = []
+                if progress is not None:
+                    progress(imported, skipped)
+        
+        if chunk:
+            write(chunk)
+            imported += len(chunk)
+        if progress is not None:
+            progress(imported, skipped)
+        return imported, skipped
+    finally:
+        db.close()
+
+def export_records(db_path: str, stream: TextIO, fmt: str = "csv", guild_id: Optional[int] = None,
+                   chunk_size: int = 50_000, progress: Optional[Callable[[int], None]] = None) -> int:
+    db = sqlite3.connect(db_path)
+    try:
+        if guild_id is None:
+            cursor = db.execute(f"SELECT {', '.join(FIELDS)} FROM user_levels")
+        else:
+            cursor = db.execute(f"SELECT {', '.join(FIELDS)} FROM user_levels WHERE guild_id = ?", (guild_id,))
+        
+        if fmt == "csv":
+            writer = csv.writer(stream)
+            writer.writerow(FIELDS)
+            write_rows = writer.writerows
+        else:
+            def write_rows(rows):
+                stream.writelines(json.dumps(dict(zip(FIELDS, row))) + "\n" for row in rows)
+        
+        # The cursor is drained a chunk at a time, so memory stays flat no
+        # matter how many rows are exported.
+        exported = 0
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            write_rows(rows)
+            exported += len(rows)
+            if progress is not None:
+                progress(exported)
+        return exported
+    finally:
+        db.close()
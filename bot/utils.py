@@ -8,6 +8,27 @@ def create_progress_bar(percentage: float, length: int = 20) -> str:
     bar = "█" * filled + "░" * empty
     return f"`{bar}` {percentage:.1f}%"
 
+def create_level_histogram(levels: list, max_rows: int = 10, length: int = 12) -> str:
+    if not levels:
+        return ""
+    
+    # Levels are grouped into at most max_rows equal ranges so the chart
+    # fits in an embed field however spread out the guild is.
+    top = levels[-1][0]
+    width = top // max_rows + 1
+    ranges = {}
+    for level, members in levels:
+        start = level // width * width
+        ranges[start] = ranges.get(start, 0) + members
+    
+    most = max(ranges.values())
+    lines = []
+    for start in sorted(ranges):
+        label = f"{start}" if width == 1 else f"{start}-{start + width - 1}"
+        filled = max(1, round(length * ranges[start] / most))
+        lines.append(f"`{label:>7} {'█' * filled:<{length}}` {ranges[start]:,}")
+    return "\n".join(lines)
+
 def format_number(number: int) -> str:
     if number >= 1_000_000:
         return f"{number / 1_000_000:.1f}M"
@@ -0,0 +1,119 @@
+import discord
+from typing import Dict, Optional
+from .metrics import count_error
+
+LEADERBOARD_PAGE_SIZE = 10
+
+# period -> (title, days covered by the rolling window)
+LEADERBOARD_PERIODS = {
+    "week": ("Weekly", 7),
+    "month": ("Monthly", 30)
+}
+
+def build_leaderboard_embed(page: int, total_pages: int, page_data, names: Dict[int, str],
+                            period: Optional[str] = None) -> discord.Embed:
+    title = f"{LEADERBOARD_PERIODS[period][0]} Leaderboard" if period else "Server Leaderboard"
+    embed = discord.Embed(
+        title=f"🏆 {title} - Page {page}",
+        color=0xffd700
+    )
+    suffix = f" this {period}" if period else ""
+    
+    description = ""
+    offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+    for i, (user_id, xp, level, messages) in enumerate(page_data, start=offset + 1):
+        username = names.get(user_id, f"User {user_id}")
+        
+        medal = ""
+        if i == 1:
+            medal = "🥇"
+        elif i == 2:
+            medal = "🥈"
+        elif i == 3:
+            medal = "🥉"
+        else:
+            medal = f"**{i}.**"
+        
+        description += f"{medal} {username}\n"
+        description += f"Level {level} • {xp:,} XP{suffix} • {messages:,} messages\n\n"
+    
+    embed.description = description
+    embed.set_footer(text=f"Page {page} of {total_pages}")
+    return embed
+
+def build_leaderboard_view(page: int, total_pages: int, page_data, period: Optional[str] = None) -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    first_user_id, first_xp = page_data[0][0], page_data[0][1]
+    last_user_id, last_xp = page_data[-1][0], page_data[-1][1]
+    
+    view.add_item(LeaderboardButton("prev", page, first_xp, first_user_id, period, disabled=page <= 1))
+    view.add_item(LeaderboardButton("next", page, last_xp, last_user_id, period, disabled=page >= total_pages))
+    return view
+
+class LeaderboardButton(discord.ui.DynamicItem[discord.ui.Button],
+                        template=r'lb:(?:(?P<period>week|month):)?(?P<direction>prev|next):(?P<page>[0-9]+):(?P<xp>-?[0-9]+):(?P<user_id>[0-9]+)'):
+    # The keyset cursor lives in the custom id, so buttons keep working on
+    # old messages and across restarts without any stored view state.
+    def __init__(self, direction: str, page: int, xp: int, user_id: int,
+                 period: Optional[str] = None, disabled: bool = False):
+        prefix = f"lb:{period}:" if period else "lb:"
+        super().__init__(
+            discord.ui.Button(
+                label="◀ Previous" if direction == "prev" else "Next ▶",
+                style=discord.ButtonStyle.secondary,
+                custom_id=f"{prefix}{direction}:{page}:{xp}:{user_id}",
+                disabled=disabled
+            )
+        )
+        self.direction = direction
+        self.page = page
+        self.xp = xp
+        self.user_id = user_id
+        self.period = period
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match['direction'], int(match['page']), int(match['xp']), int(match['user_id']), match['period'])
+    
+    async def callback(self, interaction: discord.Interaction):
+        bot = interaction.client
+        guild_id = interaction.guild.id
+        # Acknowledge the click first so slow reads or name lookups cannot
+        # run past the interaction deadline; the message is edited after.
+        await interaction.response.defer()
+        
+        try:
+            if self.direction == "next":
+                page = self.page + 1
+                cursor = {'after': (self.xp, self.user_id)}
+            else:
+                page = self.page - 1
+                cursor = {'before': (self.xp, self.user_id)}
+            
+            if self.period:
+                days = LEADERBOARD_PERIODS[self.period][1]
+                page_data = await bot.db.get_period_leaderboard_page(guild_id, days, LEADERBOARD_PAGE_SIZE, **cursor)
+            else:
+                page_data = await bot.db.get_leaderboard_page(guild_id, LEADERBOARD_PAGE_SIZE, **cursor)
+            
+            if not page_data:
+                await interaction.followup.send("There are no more users on the leaderboard!", ephemeral=True)
+                return
+            
+            if self.period:
+                total_users = await bot.db.count_period_users(guild_id, days)
+            else:
+                total_users = await bot.db.count_ranked_users(guild_id)
+            total_pages = max(1, (total_users + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE)
+            page = max(1, min(page, total_pages))
+            
+            names = await bot.names.resolve(interaction.guild, [row[0] for row in page_data])
+            await interaction.edit_original_response(
+                embed=build_leaderboard_embed(page, total_pages, page_data, names, self.period),
+                view=build_leaderboard_view(page, total_pages, page_data, self.period)
+            )
+        
+        except Exception as e:
+            count_error("leaderboard_page")
+            print(f"Error fetching leaderboard page: {e}")
+            await interaction.followup.send("An error occurred while fetching leaderboard data.", ephemeral=True)
@@ -0,0 +1,108 @@
+import asyncio
+import discord
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from .leveling import LevelingSystem
+from .metrics import count_error
+
+def can_earn(state: discord.VoiceState) -> bool:
+    return not (state.self_mute or state.mute or state.self_deaf or state.deaf)
+
+class VoiceTracker:
+    def __init__(self, leveling: LevelingSystem,
+                 on_level_up: Callable[[discord.Member, discord.abc.Messageable, dict], Awaitable[None]],
+                 interval: float = 60.0):
+        self.leveling = leveling
+        self.on_level_up = on_level_up
+        self.interval = interval
+        # channel_id -> {member_id: can_earn}; kept current from voice state
+        # events, so a tick never has to walk guilds or channels.
+        self._members: Dict[int, Dict[int, bool]] = {}
+        self._channels: Dict[int, discord.VoiceChannel] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def __len__(self) -> int:
+        return sum(len(members) for members in self._members.values())
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    def update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        if member.bot:
+            return
+        if before.channel is not None:
+            self._leave(before.channel.id, member.id)
+        if after.channel is not None:
+            self._join(after.channel, member, after)
+    
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        # Voice state events missed while disconnected are recovered from
+        # the member cache after every (re)connect.
+        self._members.clear()
+        self._channels.clear()
+        for guild in guilds:
+            for channel in guild.voice_channels:
+                for member in channel.members:
+                    if not member.bot and member.voice is not None:
+                        self._join(channel, member, member.voice)
+    
+    def _join(self, channel, member: discord.Member, state: discord.VoiceState):
+        if channel == member.guild.afk_channel:
+            return
+        self._channels[channel.id] = channel
+        self._members.setdefault(channel.id, {})[member.id] = can_earn(state)
+    
+    def _leave(self, channel_id: int, member_id: int):
+        members = self._members.get(channel_id)
+        if members is None:
+            return
+        members.pop(member_id, None)
+        if not members:
+            del self._members[channel_id]
+            self._channels.pop(channel_id, None)
+    
+    def eligible(self) -> Tuple[Dict[int, List[int]], Dict[Tuple[int, int], discord.VoiceChannel]]:
+        # Members who can talk and listen and are not alone in the channel;
+        # anyone muted or deafened still counts as company for the others.
+        members_by_guild: Dict[int, List[int]] = {}
+        channels: Dict[Tuple[int, int], discord.VoiceChannel] = {}
+        for channel_id, members in self._members.items():
+            if len(members) < 2:
+                continue
+            channel = self._channels[channel_id]
+            earners = [member_id for member_id, earning in members.items() if earning]
+            if not earners:
+                continue
+            members_by_guild.setdefault(channel.guild.id, []).extend(earners)
+            for member_id in earners:
+                channels[(channel.guild.id, member_id)] = channel
+        return members_by_guild, channels
+    
+    async def tick(self):
+        members_by_guild, channels = self.eligible()
+        if not members_by_guild:
+            return
+        
+        results = await self.leveling.award_voice_xp(members_by_guild, self.interval / 60)
+        for user_id, guild_id, result in results:
+            if not result['level_up']:
+                continue
+            channel = channels[(guild_id, user_id)]
+            member = channel.guild.get_member(user_id)
+            if member is not None:
+                await self.on_level_up(member, channel, result)
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                count_error("voice_tick")
+                print(f"Error awarding voice XP: {e}")
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import glob
+import os
+import re
+import signal
+import sys
+import time
+from typing import List
+import discord
+from bot.coordinator import WriteLeaseServer
+from bot.database import Database, journal_path
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+def shard_groups(shard_count: int, processes: int) -> List[List[int]]:
+    # Shards are dealt out round-robin so every process gets an even share.
+    processes = max(1, min(processes, shard_count))
+    return [list(range(index, shard_count, processes)) for index in range(processes)]
+
+async def recommended_shards(token: str) -> int:
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shards, _, _ = await http.get_bot_gateway()
+        return shards
+    finally:
+        await http.close()
+
+async def replay_stale_journals(db_path: str, processes: int):
+    # Journals left by processes that no longer exist (the cluster was
+    # shrunk) are replayed once here; replay does not depend on the shard.
+    pattern = re.compile(re.escape(db_path) + r"\.(\d+)\.xpjournal$")
+    for path in glob.glob(glob.escape(db_path) + ".*.xpjournal"):
+        match = pattern.match(path)
+        if match is None or int(match.group(1)) <= processes:
+            continue
+        
+        journal_id = int(match.group(1))
+        db = Database(db_path, readers=1, journal_id=journal_id)
+        await db.initialize()
+        await db.close()
+        os.remove(journal_path(db_path, journal_id))
+        print(f"Replayed journal {journal_id} from a removed process")
+
+class Supervisor:
+    def __init__(self, groups: List[List[int]], shard_count: int, db_path: str, socket_path: str):
+        self.groups = groups
+        self.shard_count = shard_count
+        self.db_path = db_path
+        self.lease_server = WriteLeaseServer(socket_path)
+        self.processes = {}
+        self.stopping = asyncio.Event()
+    
+    def environment(self, cluster_id: int) -> dict:
+        env = dict(os.environ)
+        env.update({
+            'LEVELBOT_CLUSTER_ID': str(cluster_id),
+            'LEVELBOT_SHARD_IDS': ",".join(map(str, self.groups[cluster_id])),
+            'LEVELBOT_SHARD_COUNT': str(self.shard_count),
+            'LEVELBOT_LEASE_SOCKET': os.path.abspath(self.lease_server.path),
+            'LEVELBOT_DB': self.db_path
+        })
+        return env
+    
+    async def run_process(self, cluster_id: int):
+        failures = 0
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            # Each process gets its own session, so a Ctrl+C reaches only the
+            # supervisor, which then shuts the processes down in order.
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, MAIN, env=self.environment(cluster_id), start_new_session=True
+            )
+            self.processes[cluster_id] = process
+            print(f"Process {cluster_id} (pid {process.pid}) started with shards {self.groups[cluster_id]}")
+            code = await process.wait()
+            if self.stopping.is_set():
+                break
+            
+            failures = 0 if time.monotonic() - started > 60 else failures + 1
+            delay = min(60, 2 ** failures)
+            print(f"Process {cluster_id} exited with code {code}; restarting in {delay}s")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def stop_processes(self, timeout: float):
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+        
+        for cluster_id, process in self.processes.items():
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Process {cluster_id} did not stop in {timeout}s; killing it")
+                process.kill()
+                await process.wait()
+    
+    async def run(self, stop_timeout: float = 30.0):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+        
+        await self.lease_server.start()
+        runners = [asyncio.create_task(self.run_process(cluster_id)) for cluster_id in range(len(self.groups))]
+        try:
+            await self.stopping.wait()
+            print("Stopping cluster")
+            await self.stop_processes(stop_timeout)
+            await asyncio.gather(*runners)
+        finally:
+            await self.lease_server.stop()
+
+async def run_cluster(args) -> int:
+    shard_count = args.shards
+    if shard_count is None:
+        token = os.getenv('DISCORD_TOKEN')
+        if not token:
+            print("Error: DISCORD_TOKEN environment variable not set")
+            return 1
+        shard_count = await recommended_shards(token)
+    
+    groups = shard_groups(shard_count, args.processes)
+    await replay_stale_journals(args.db, len(groups))
+    print(f"Running {shard_count} shards in {len(groups)} processes")
+    await Supervisor(groups, shard_count, args.db, args.socket).run(args.stop_timeout)
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the level bot as several sharded processes")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="shard processes to run")
+    parser.add_argument("--shards", type=int, help="total shard count (default: Discord's recommendation)")
+    parser.add_argument("--db", default="levelbot.db", help="path to the SQLite database")
+    parser.add_argument("--socket", default="levelbot-lease.sock", help="Unix socket for the write lease")
+    parser.add_argument("--stop-timeout", type=float, default=30.0, help="seconds to wait for a clean shutdown")
+    args = parser.parse_args(argv)
+    return asyncio.run(run_cluster(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
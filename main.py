@@ -3,13 +3,20 @@ from discord.ext import commands
 import asyncio
 import os
 import json
+import signal
 from bot.database import Database
 from bot.leveling import LevelingSystem
 from bot.events import Events
 from bot.commands import LevelCommands
+from bot.views import LeaderboardButton
+from bot.backfill import RoleBackfill
+from bot.ranking import BYTES_PER_MEMBER
+from bot.names import NameResolver
+from bot.coordinator import WriteLease
+from bot.metrics import metrics, start_metrics_server
 
-class LevelBot(commands.Bot):
-    def __init__(self):
+class LevelBot(commands.AutoShardedBot):
+    def __init__(self, shard_ids=None, shard_count=None, cluster_id=0, lease_socket=None):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.guilds = True
@@ -18,20 +25,65 @@ class LevelBot(commands.Bot):
         super().__init__(
             command_prefix='!',
             intents=intents,
-            help_command=None
+            help_command=None,
+            shard_ids=shard_ids,
+            shard_count=shard_count
         )
         
-        self.db = Database()
+        # Every event for a guild arrives on the shard that owns it, so the
+        # per-guild state below only ever lives in one cluster process.
+        self.cluster_id = cluster_id
+        self.db = Database(
+            os.getenv('LEVELBOT_DB', 'levelbot.db'),
+            journal_id=cluster_id + 1,
+            write_lease=WriteLease(lease_socket) if lease_socket else None
+        )
         self.leveling = LevelingSystem(self.db)
+        self.role_backfill = RoleBackfill(self)
+        self.names = NameResolver(self)
+        self.metrics_server = None
+        self.events = None
+        
+        metrics.gauge("levelbot_xp_buffer_pending", "Users with unflushed XP", lambda: len(self.db.buffer))
+        metrics.gauge("levelbot_cooldowns_tracked", "Members tracked for cooldowns and repeat checks", lambda: len(self.leveling.cooldowns))
+        metrics.gauge("levelbot_guild_configs_cached", "Guild configs in cache", lambda: len(self.db._guild_configs))
+        metrics.gauge("levelbot_rank_index_members", "Members held in rank indexes", lambda: self.db.ranks.tracked_members)
+        metrics.gauge("levelbot_rank_index_bytes", "Estimated memory held by rank indexes", lambda: self.db.ranks.tracked_members * BYTES_PER_MEMBER)
+        metrics.gauge("levelbot_level_recalculations", "Running level recalculations", lambda: len(self.leveling.recalculations))
+        metrics.gauge("levelbot_role_backfill_jobs", "Running role backfill jobs", lambda: len(self.role_backfill.jobs))
+        metrics.gauge("levelbot_name_cache_entries", "Display names in the name cache", lambda: len(self.names))
+        metrics.gauge("levelbot_ingest_queue_depth", "Messages waiting for XP processing", lambda: len(self.events.queue))
+        metrics.gauge("levelbot_ingest_deferred", "Level-up announcements delayed by overload", lambda: self.events.queue.deferred)
+        metrics.gauge("levelbot_voice_members", "Members tracked in voice channels", lambda: len(self.events.voice))
+        metrics.gauge("levelbot_announcements_pending", "Level-ups waiting to be announced", lambda: len(self.events.announcements))
         
     async def setup_hook(self):
         await self.db.initialize()
-        await self.add_cog(Events(self))
+        self.events = Events(self)
+        await self.add_cog(self.events)
         await self.add_cog(LevelCommands(self))
+        self.add_dynamic_items(LeaderboardButton)
+        await self.role_backfill.resume()
         
+        metrics_port = os.getenv('METRICS_PORT')
+        if metrics_port:
+            self.metrics_server = await start_metrics_server(
+                os.getenv('METRICS_HOST', '127.0.0.1'), int(metrics_port) + self.cluster_id
+            )
+    
+    async def close(self):
+        await self.role_backfill.stop()
+        await super().close()
+        await self.leveling.stop()
+        await self.db.close()
+        if self.db.write_lease is not None:
+            self.db.write_lease.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.cleanup()
+    
     async def on_ready(self):
         print(f'{self.user} has connected to Discord!')
-        print(f'Bot is in {len(self.guilds)} guilds')
+        print(f'Bot is in {len(self.guilds)} guilds on shards {sorted(self.shards)}')
         
         activity = discord.Activity(
             type=discord.ActivityType.watching,
@@ -40,7 +92,21 @@ class LevelBot(commands.Bot):
         await self.change_presence(activity=activity)
 
 async def main():
-    bot = LevelBot()
+    # Set by cluster.py; a standalone process runs every shard itself.
+    shard_ids = os.getenv('LEVELBOT_SHARD_IDS')
+    shard_count = os.getenv('LEVELBOT_SHARD_COUNT')
+    bot = LevelBot(
+        shard_ids=[int(shard_id) for shard_id in shard_ids.split(',')] if shard_ids else None,
+        shard_count=int(shard_count) if shard_count else None,
+        cluster_id=int(os.getenv('LEVELBOT_CLUSTER_ID', '0')),
+        lease_socket=os.getenv('LEVELBOT_LEASE_SOCKET')
+    )
+    
+    try:
+        # The cluster supervisor stops processes with SIGTERM.
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass
     
     token = os.getenv('DISCORD_TOKEN')
     if not token:
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import sys
+import time
+from bot.database import Database
+from bot.recompute import numpy, recompute_offline
+from bot.transfer import IMPORT_MODES, READERS, export_records, import_records
+
+def recompute(args) -> int:
+    started = time.perf_counter()
+    
+    def progress(scanned: int, changed: int):
+        elapsed = time.perf_counter() - started
+        print(f"\r{scanned:,} rows checked, {changed:,} levels wrong ({scanned / max(elapsed, 1e-9):,.0f} rows/s)",
+              end="", file=sys.stderr, flush=True)
+    
+    if numpy is None:
+        print("numpy is not installed; computing levels row by row", file=sys.stderr)
+    
+    scanned, changed = recompute_offline(
+        args.db,
+        guild_id=args.guild,
+        chunk_size=args.chunk_size,
+        dry_run=args.dry_run,
+        progress=None if args.quiet else progress
+    )
+    
+    if not args.quiet:
+        print(file=sys.stderr)
+    verb = "would be corrected" if args.dry_run else "corrected"
+    print(f"{scanned:,} rows checked, {changed:,} levels {verb} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+async def create_schema(db_path: str):
+    db = Database(db_path, readers=1, journal=False)
+    await db.initialize()
+    await db.close()
+
+async def run_migrations(db_path: str, chunk_size: int):
+    db = Database(db_path, readers=1, journal=False)
+    await db.initialize()
+    try:
+        await db.run_online_migrations(chunk_size=chunk_size, pause=0)
+    finally:
+        await db.close()
+
+def migrate(args) -> int:
+    started = time.perf_counter()
+    asyncio.run(run_migrations(args.db, args.chunk_size))
+    print(f"Schema up to date in {time.perf_counter() - started:.1f}s")
+    return 0
+
+def import_data(args) -> int:
+    asyncio.run(create_schema(args.db))
+    started = time.perf_counter()
+    
+    def progress(imported: int, skipped: int):
+        elapsed = time.perf_counter() - started
+        print(f"\r{imported:,} rows imported, {skipped:,} skipped ({imported / max(elapsed, 1e-9):,.0f} rows/s)",
+              end="", file=sys.stderr, flush=True)
+    
+    stream = sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8")
+    try:
+        imported, skipped = import_records(
+            args.db,
+            READERS[args.format](stream),
+            guild_id=args.guild,
+            mode=args.mode,
+            chunk_size=args.chunk_size,
+            progress=None if args.quiet else progress
+        )
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"{imported:,} rows imported, {skipped:,} skipped in {time.perf_counter() - started:.1f}s")
+    return 0 if imported or not skipped else 1
+
+def export_data(args) -> int:
+    started = time.perf_counter()
+    
+    def progress(exported: int):
+        print(f"\r{exported:,} rows exported", end="", file=sys.stderr, flush=True)
+    
+    stream = sys.stdout if args.file == "-" else open(args.file, "w", newline="", encoding="utf-8")
+    try:
+        exported = export_records(
+            args.db,
+            stream,
+            fmt=args.format,
+            guild_id=args.guild,
+            chunk_size=args.chunk_size,
+            progress=None if args.quiet else progress
+        )
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"{exported:,} rows exported in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintenance tasks for the level bot database")
+    parser.add_argument("--db", default="levelbot.db", help="path to the SQLite database")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    
+    parser_recompute = subcommands.add_parser("recompute", help="recompute stored levels from XP")
+    parser_recompute.add_argument("--guild", type=int, help="only this guild (default: every guild)")
+    parser_recompute.add_argument("--chunk-size", type=int, default=100_000)
+    parser_recompute.add_argument("--dry-run", action="store_true", help="count wrong levels without writing")
+    parser_recompute.set_defaults(handler=recompute)
+    
+    parser_migrate = subcommands.add_parser("migrate", help="apply schema migrations and finish online ones now")
+    parser_migrate.add_argument("--chunk-size", type=int, default=100_000)
+    parser_migrate.set_defaults(handler=migrate)
+    
+    parser_import = subcommands.add_parser("import", help="load XP data from a file")
+    parser_import.add_argument("file", help="file to read, or - for stdin")
+    parser_import.add_argument("--format", choices=sorted(READERS), default="csv")
+    parser_import.add_argument("--guild", type=int, help="import every row into this guild")
+    parser_import.add_argument("--mode", choices=IMPORT_MODES, default="upsert",
+                               help="upsert replaces imported members only; overwrite clears each imported guild first")
+    parser_import.add_argument("--chunk-size", type=int, default=50_000)
+    parser_import.set_defaults(handler=import_data)
+    
+    parser_export = subcommands.add_parser("export", help="write XP data to a file")
+    parser_export.add_argument("file", help="file to write, or - for stdout")
+    parser_export.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    parser_export.add_argument("--guild", type=int, help="only this guild (default: every guild)")
+    parser_export.add_argument("--chunk-size", type=int, default=50_000)
+    parser_export.set_defaults(handler=export_data)
+    
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())